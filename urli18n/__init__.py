@@ -16,7 +16,53 @@ if not isinstance(app_settings.URLI18N_INCLUDE_PATHS, (list, tuple)):
             raise exceptions.ImproperlyConfigured('All elements in URLI18N_INCLUDE_PATHS need to be set to a str or unicode.')
 if not isinstance(app_settings.URLI18N_QUERYSTRING_NAME, (str, unicode)):
     raise exceptions.ImproperlyConfigured('URLI18N_QUERYSTRING_NAME need to be set to a str or unicode value.')
+if app_settings.URLI18N_DISPATCH_MODE not in ('view', 'path_info', 'urlconf'):
+    raise exceptions.ImproperlyConfigured('URLI18N_DISPATCH_MODE need to be set to \'view\', \'path_info\' or \'urlconf\'.')
 
-if 'urli18n.middleware.UrlPathTransformMiddleware' in settings.MIDDLEWARE_CLASSES\
-and 'urli18n.middleware.UrlQuerystringTransformMiddleware' in settings.MIDDLEWARE_CLASSES:
+if not isinstance(app_settings.URLI18N_RESOLVE_CACHE_SIZE, (int, long)):
+    raise exceptions.ImproperlyConfigured('URLI18N_RESOLVE_CACHE_SIZE need to be set to an integer value.')
+if not isinstance(app_settings.URLI18N_TRANSFORM_CACHE_SIZE, (int, long)):
+    raise exceptions.ImproperlyConfigured('URLI18N_TRANSFORM_CACHE_SIZE need to be set to an integer value.')
+if not isinstance(app_settings.URLI18N_REVERSE_CACHE_SIZE, (int, long)):
+    raise exceptions.ImproperlyConfigured('URLI18N_REVERSE_CACHE_SIZE need to be set to an integer value.')
+if not isinstance(app_settings.URLI18N_ALTERNATES_CACHE_SIZE, (int, long)):
+    raise exceptions.ImproperlyConfigured('URLI18N_ALTERNATES_CACHE_SIZE need to be set to an integer value.')
+if not isinstance(app_settings.URLI18N_INCLUDE_CACHE_SIZE, (int, long)):
+    raise exceptions.ImproperlyConfigured('URLI18N_INCLUDE_CACHE_SIZE need to be set to an integer value.')
+if not isinstance(app_settings.URLI18N_INCLUDE_CACHE_NORMALIZE_DIGITS, bool):
+    raise exceptions.ImproperlyConfigured('URLI18N_INCLUDE_CACHE_NORMALIZE_DIGITS need to be set to a boolean value.')
+if not isinstance(app_settings.URLI18N_REWRITE_RESPONSE_LINKS, bool):
+    raise exceptions.ImproperlyConfigured('URLI18N_REWRITE_RESPONSE_LINKS need to be set to a boolean value.')
+if not isinstance(app_settings.URLI18N_REWRITE_RESPONSE_BUDGET, (int, long)):
+    raise exceptions.ImproperlyConfigured('URLI18N_REWRITE_RESPONSE_BUDGET need to be set to an integer value.')
+if not isinstance(app_settings.URLI18N_REWRITE_REDIRECTS, bool):
+    raise exceptions.ImproperlyConfigured('URLI18N_REWRITE_REDIRECTS need to be set to a boolean value.')
+if not isinstance(app_settings.URLI18N_SERVE_IN_PLACE, bool):
+    raise exceptions.ImproperlyConfigured('URLI18N_SERVE_IN_PLACE need to be set to a boolean value.')
+if not isinstance(app_settings.URLI18N_REDIRECT_STATUS, dict)\
+or [status for status in app_settings.URLI18N_REDIRECT_STATUS.values() if status not in (301, 302, 303, 307, 308)]:
+    raise exceptions.ImproperlyConfigured('URLI18N_REDIRECT_STATUS need to be a dict of redirect status codes (301, 302, 303, 307 or 308).')
+if app_settings.URLI18N_REDIRECT_CACHE_CONTROL is not None\
+and not isinstance(app_settings.URLI18N_REDIRECT_CACHE_CONTROL, (str, unicode)):
+    raise exceptions.ImproperlyConfigured('URLI18N_REDIRECT_CACHE_CONTROL need to be set to None or a str or unicode value.')
+if app_settings.URLI18N_PAGE_CACHE is not None\
+and not isinstance(app_settings.URLI18N_PAGE_CACHE, (str, unicode)):
+    raise exceptions.ImproperlyConfigured('URLI18N_PAGE_CACHE need to be set to None or a str or unicode value.')
+if not isinstance(app_settings.URLI18N_PAGE_CACHE_TIMEOUT, (int, long)):
+    raise exceptions.ImproperlyConfigured('URLI18N_PAGE_CACHE_TIMEOUT need to be set to an integer value.')
+if not isinstance(app_settings.URLI18N_CANONICAL_QUERYSTRING, bool):
+    raise exceptions.ImproperlyConfigured('URLI18N_CANONICAL_QUERYSTRING need to be set to a boolean value.')
+if not isinstance(app_settings.URLI18N_STRIP_QUERYSTRING_PARAMETERS, (list, tuple)):
+    raise exceptions.ImproperlyConfigured('URLI18N_STRIP_QUERYSTRING_PARAMETERS need to be a list or tuple.')
+if not isinstance(app_settings.URLI18N_HOSTS, dict):
+    raise exceptions.ImproperlyConfigured('URLI18N_HOSTS need to be a dict of language shortcuts and hosts.')
+if not isinstance(app_settings.URLI18N_SCOPE_LANGUAGE, bool):
+    raise exceptions.ImproperlyConfigured('URLI18N_SCOPE_LANGUAGE need to be set to a boolean value.')
+
+#compile the include path matchers once at startup
+utils.get_include_matcher(strict_mode=True)
+utils.get_include_matcher(strict_mode=False)
+
+if len([middleware_class for middleware_class in (utils.PATH_MIDDLEWARE, utils.QUERYSTRING_MIDDLEWARE, utils.HOST_MIDDLEWARE)
+        if middleware_class in utils.get_middleware_classes()]) > 1:
     raise exceptions.ImproperlyConfigured('Only one of the middleware classes provided by urli18n can be used in settings.MIDDLEWARE_CLASSES.')
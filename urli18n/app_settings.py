@@ -33,3 +33,169 @@ This need to be a string representing the name of the
 language key in the query-string. It defaults to 'lang'.
 """
 URLI18N_QUERYSTRING_NAME = getattr(settings, 'URLI18N_QUERYSTRING_NAME', 'lang')
+
+"""Only need to set this if you use
+``'urli18n.middleware.UrlPathTransformMiddleware'``.
+This determines how the middleware dispatches a request
+to a url path with a valid language prefix:
+
+- ``'view'`` (the default) resolves the path without the prefix and calls the view directly from the middleware, after processing the ``process_request`` and ``process_view`` methods of the other middleware's
+- ``'path_info'`` only removes the prefix from ``request.path_info`` and lets Django resolve the path and call the view as usual, with all other middleware's processed by Django's handler
+- ``'urlconf'`` leaves url path's with a language prefix to a url conf built with ``urli18n.urls.language_prefixed_urlpatterns``, the middleware only activates the language captured by it
+
+If the middleware is used within the ``MIDDLEWARE`` setting of newer
+Django versions it always dispatches via ``'path_info'``.
+"""
+URLI18N_DISPATCH_MODE = getattr(settings, 'URLI18N_DISPATCH_MODE', 'view')
+
+"""Only need to set this if you use
+``'urli18n.middleware.UrlPathTransformMiddleware'`` with
+``URLI18N_DISPATCH_MODE`` set to ``'view'``. If set to a number
+greater than 0 the results of resolving url path's without their
+language prefix are kept in a LRU cache of this size. The statistics
+of the cache are available via ``urli18n.utils.cache_info('resolve')``.
+It defaults to 0 (no caching).
+"""
+URLI18N_RESOLVE_CACHE_SIZE = getattr(settings, 'URLI18N_RESOLVE_CACHE_SIZE', 0)
+
+"""The maximum number of url path's transformed by the ``transform_url``
+template filter which are kept in a LRU cache. Set it to 0 to disable
+the cache. It defaults to 1000.
+"""
+URLI18N_TRANSFORM_CACHE_SIZE = getattr(settings, 'URLI18N_TRANSFORM_CACHE_SIZE', 1000)
+
+"""If set to a number greater than 0 the results of checking
+url path's against ``URLI18N_INCLUDE_PATHS`` are kept in a LRU cache
+of this size. The statistics of the cache are available via
+``urli18n.utils.cache_info('include_path')``. It defaults to 0
+(no caching).
+"""
+URLI18N_INCLUDE_CACHE_SIZE = getattr(settings, 'URLI18N_INCLUDE_CACHE_SIZE', 0)
+
+"""If set to True all digits of path segments consisting only
+of digits are replaced by ``0`` before looking up a path in the
+cache set up by ``URLI18N_INCLUDE_CACHE_SIZE``. This way path's like
+``/articles/2011/05/`` and ``/articles/2012/06/`` share one entry.
+Only set this if none of the expressions in ``URLI18N_INCLUDE_PATHS``
+distinguishes numbers of the same length (e.g. ``^/page/1/$``).
+It defaults to False.
+"""
+URLI18N_INCLUDE_CACHE_NORMALIZE_DIGITS = getattr(settings, 'URLI18N_INCLUDE_CACHE_NORMALIZE_DIGITS', False)
+
+"""The maximum number of url's reversed by ``urli18n.utils.reverse``
+and the ``i18n_url`` template tag which are kept in a LRU cache.
+Set it to 0 to disable the cache. It defaults to 1000.
+"""
+URLI18N_REVERSE_CACHE_SIZE = getattr(settings, 'URLI18N_REVERSE_CACHE_SIZE', 1000)
+
+"""The maximum number of url path's for which the links rendered by
+the ``urli18n_alternates`` template tag are kept in a LRU cache.
+Set it to 0 to disable the cache. It defaults to 1000.
+"""
+URLI18N_ALTERNATES_CACHE_SIZE = getattr(settings, 'URLI18N_ALTERNATES_CACHE_SIZE', 1000)
+
+"""If set to True the middleware classes rewrite the internal links
+(``href`` and ``action`` attributes) of ``text/html`` responses
+according to the active language, the same way as the ``transform_url``
+template tag would, so links which are not transformed in the templates
+don't cause an extra redirect. Streaming responses are rewritten chunk
+by chunk. It defaults to False.
+"""
+URLI18N_REWRITE_RESPONSE_LINKS = getattr(settings, 'URLI18N_REWRITE_RESPONSE_LINKS', False)
+
+"""The maximum number of bytes of a response in which the links are
+rewritten if ``URLI18N_REWRITE_RESPONSE_LINKS`` is set. The rest of the
+response is passed through unchanged. Set it to 0 to rewrite responses
+of any size. It defaults to 1048576 (1 MB).
+"""
+URLI18N_REWRITE_RESPONSE_BUDGET = getattr(settings, 'URLI18N_REWRITE_RESPONSE_BUDGET', 1048576)
+
+"""If set to True the middleware classes transform the ``Location``
+of redirects (301, 302, 303, 307 and 308 responses) to included
+internal url path's for the active language, so the browser doesn't
+need to be redirected a second time by the middleware. It defaults
+to False.
+"""
+URLI18N_REWRITE_REDIRECTS = getattr(settings, 'URLI18N_REWRITE_REDIRECTS', False)
+
+"""If set to True requests for included url path's without language
+are not redirected to the url with the active language. The view is
+rendered right away instead and the response points to the url with
+language with the ``Content-Location`` and a ``Link: <...>; rel="canonical"``
+header, varying on ``Accept-Language`` and ``Cookie``. It defaults to False.
+"""
+URLI18N_SERVE_IN_PLACE = getattr(settings, 'URLI18N_SERVE_IN_PLACE', False)
+
+"""The status codes of the redirects of the middleware classes, by
+cause of the redirect: ``'missing'`` for url's without language,
+``'switch'`` for url's with another language than the active one,
+``'default'`` for url's showing the default language although
+``URLI18N_ALWAYS_SHOW_LANGUAGE`` is set to False and ``'slash'``
+for url's only missing the trailing slash (see ``APPEND_SLASH``).
+Allowed are 301, 302, 303, 307 and 308. The given causes replace
+the defaults ``{'missing': 302, 'switch': 302, 'default': 302, 'slash': 301, 'canonical': 301}``
+(``'canonical'`` is used for url's only missing the canonical query string,
+see ``URLI18N_CANONICAL_QUERYSTRING``).
+"""
+URLI18N_REDIRECT_STATUS = dict({'missing': 302, 'switch': 302, 'default': 302, 'slash': 301, 'canonical': 301},
+                               **getattr(settings, 'URLI18N_REDIRECT_STATUS', {}))
+
+"""The ``Cache-Control`` header of the redirects of the middleware
+classes, for example ``'max-age=3600'``. Redirects depending on the
+negotiated language vary on ``Accept-Language`` and ``Cookie``. It
+defaults to None (no ``Cache-Control`` header).
+"""
+URLI18N_REDIRECT_CACHE_CONTROL = getattr(settings, 'URLI18N_REDIRECT_CACHE_CONTROL', None)
+
+"""The cache (a name of ``settings.CACHES`` or a cache backend) used to
+cache the pages of included url path's per language. The middleware
+classes look the page up before the view is resolved and store complete
+``200`` responses which don't set cookies, aren't private and don't
+vary on cookies. It defaults to None (no page cache).
+"""
+URLI18N_PAGE_CACHE = getattr(settings, 'URLI18N_PAGE_CACHE', None)
+
+"""The number of seconds the pages are kept in the page cache set up
+by ``URLI18N_PAGE_CACHE``. It defaults to Django's ``CACHE_MIDDLEWARE_SECONDS``.
+"""
+URLI18N_PAGE_CACHE_TIMEOUT = getattr(settings, 'URLI18N_PAGE_CACHE_TIMEOUT', getattr(settings, 'CACHE_MIDDLEWARE_SECONDS', 600))
+
+"""If set to True ``'urli18n.middleware.UrlQuerystringTransformMiddleware'``
+redirects to a canonical query string (see ``urli18n.utils.canonical_querystring``):
+the parameters of ``URLI18N_STRIP_QUERYSTRING_PARAMETERS`` are removed,
+the other parameters are sorted by name and the language parameter comes
+last. This is done in the same redirect which adds the language. It
+defaults to False.
+"""
+URLI18N_CANONICAL_QUERYSTRING = getattr(settings, 'URLI18N_CANONICAL_QUERYSTRING', False)
+
+"""The names of the query string parameters removed from the canonical
+query string if ``URLI18N_CANONICAL_QUERYSTRING`` is set, for example
+tracking parameters which are only read by scripts in the browser.
+It defaults to the ``utm_*`` parameters, ``gclid`` and ``fbclid``.
+"""
+URLI18N_STRIP_QUERYSTRING_PARAMETERS = getattr(settings, 'URLI18N_STRIP_QUERYSTRING_PARAMETERS',
+                                               ('utm_source', 'utm_medium', 'utm_campaign', 'utm_term',
+                                                'utm_content', 'gclid', 'fbclid'))
+
+"""A dictionary mapping language shortcuts to hosts, used by
+``'urli18n.middleware.UrlHostTransformMiddleware'`` to activate the
+language of the requested host, for example
+``{'de': 'de.example.com', 'en': 'www.example.com'}``. With this middleware
+``transform_path`` moves included url path's to the host of the language
+(``//de.example.com/home/``). It defaults to an empty dictionary.
+"""
+URLI18N_HOSTS = getattr(settings, 'URLI18N_HOSTS', {})
+
+"""If set to True the language activated by the middleware classes
+for a request is deactivated again in ``process_response``, restoring
+the language which was active before. Django keeps the active language
+per thread, so without ``LocaleMiddleware`` (which deactivates the
+language after each response) the language of one request would
+otherwise stay active for the next request served by the same thread
+or greenlet. With ``LocaleMiddleware`` it has no effect, so the language
+is still active while its ``process_response`` sets ``Content-Language``.
+``request.LANGUAGE_CODE`` always holds the language of the request. It
+defaults to False.
+"""
+URLI18N_SCOPE_LANGUAGE = getattr(settings, 'URLI18N_SCOPE_LANGUAGE', False)
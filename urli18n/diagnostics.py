@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+import urlparse
+
+from django.test import client as test_client
+
+
+REDIRECT_STATUS_CODES = (301, 302, 303, 307, 308)
+
+
+def follow_redirects(url, client=None, max_hops=10, **extra):
+    """Requests a url with the django test client and follows
+    its redirects within the site, like a browser would.
+    
+    Args:
+        - ``url``: the url path (with query string) to request
+        - ``client``: the ``django.test.client.Client`` to use, a new one by default
+        - ``max_hops``: the maximum number of redirects to follow
+        - ``extra``: extra ``META`` of all requests, like ``HTTP_ACCEPT_LANGUAGE`` or ``HTTP_REFERER``
+    
+    Returns:
+        - a list of ``(url, status code)`` tuples, one for every request
+    """
+    if client is None:
+        client = test_client.Client()
+    hops = []
+    seen = set()
+    while True:
+        response = client.get(url, **extra)
+        hops.append((url, response.status_code))
+        if response.status_code not in REDIRECT_STATUS_CODES or len(hops) > max_hops or url in seen:
+            break
+        seen.add(url)
+        scheme, netloc, path, query, fragment = urlparse.urlsplit(response['Location'])
+        if netloc and netloc != client.defaults.get('SERVER_NAME', 'testserver'):
+            #redirected to another site
+            hops.append((response['Location'], None))
+            break
+        url = path
+        if query:
+            url = '%s?%s' % (path, query)
+        #browsers keep the Referer of the first request (or none) when
+        #following a redirect, so ``extra`` is sent unchanged
+    return hops
+
+def find_redirect_chains(urls, min_hops=2, max_hops=10, **extra):
+    """Runs a corpus of url's through the project, including all
+    middleware classes, and returns every url which is redirected
+    ``min_hops`` times or more before a page is served (including
+    redirect loops). Every url is requested with a new client, so
+    cookies don't leak from one url to the next.
+    
+    Args:
+        - ``urls``: an iterable of url path's (with query string)
+        - ``min_hops``: the minimum number of redirects of a reported chain
+        - ``max_hops``: the maximum number of redirects followed per url
+        - ``extra``: extra ``META`` of the requests, like ``HTTP_ACCEPT_LANGUAGE``
+    
+    Returns:
+        - a list of chains, each a list of ``(url, status code)`` tuples
+    """
+    chains = []
+    for url in urls:
+        hops = follow_redirects(url, max_hops=max_hops, **dict(extra))
+        redirects = len([hop for hop in hops if hop[1] in REDIRECT_STATUS_CODES])
+        if redirects >= min_hops:
+            chains.append(hops)
+    return chains
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+import jinja2
+from jinja2 import ext
+from jinja2 import lexer
+
+from urli18n import utils
+
+
+if hasattr(jinja2, 'pass_context'):
+    pass_context = jinja2.pass_context
+else:
+    pass_context = jinja2.contextfilter
+
+
+@pass_context
+def transform_url_filter(context, path):
+    """Transforms the url path according to
+    acitivated Middleware. See ``urli18n.utils.cached_transform_path``
+    for more information. The filter is marked as context filter, so
+    Jinja2 never folds it into a constant for the language which
+    happens to be active while compiling the template.
+    """
+    return utils.cached_transform_path(path)
+
+def transform_url(path):
+    """Transforms the url path according to
+    acitivated Middleware. See ``urli18n.utils.cached_transform_path``
+    for more information.
+    """
+    return utils.cached_transform_path(path)
+
+
+class TransformUrlExtension(ext.Extension):
+    """Jinja2 extension providing ``transform_url`` as filter and
+    as global function. If it is used with a string literal
+    (``'/blog/'|transform_url`` or ``transform_url('/blog/')``) the
+    path is transformed for all languages when the template is compiled,
+    see ``urli18n.utils.PrecomputedPath``. Usage:
+    
+    ::
+        
+        env = jinja2.Environment(extensions=['urli18n.jinja2ext.TransformUrlExtension'])
+    
+    ::
+        
+        <a href="{{ '/blog/'|transform_url }}">My blog page</a>
+        <a href="{{ transform_url(blog_url) }}">My blog page</a>
+    """
+
+    def __init__(self, environment):
+        super(TransformUrlExtension, self).__init__(environment)
+        environment.extend(urli18n_precomputed_paths={})
+        environment.filters['transform_url'] = transform_url_filter
+        environment.globals['transform_url'] = transform_url
+        environment.globals['_urli18n_precomputed'] = self._precomputed
+
+    def _precomputed(self, path):
+        precomputed_path = self.environment.urli18n_precomputed_paths.get(path)
+        if precomputed_path is None:
+            #compiled code loaded from a bytecode cache
+            precomputed_path = self._precompute(path)
+        return precomputed_path.get()
+
+    def _precompute(self, path):
+        return self.environment.urli18n_precomputed_paths.setdefault(path, utils.PrecomputedPath(path))
+
+    def filter_stream(self, stream):
+        """Replaces ``'/path'|transform_url`` and ``transform_url('/path')``
+        in the token stream by a call returning the precomputed path.
+        The call only refers to the path itself, so the compiled code
+        can be shared by a bytecode cache."""
+        tokens = list(stream)
+        previous = None
+        i = 0
+        while i < len(tokens):
+            path = None
+            if _is_token(tokens, i, lexer.TOKEN_STRING)\
+            and _is_token(tokens, i + 1, lexer.TOKEN_PIPE)\
+            and _is_token(tokens, i + 2, lexer.TOKEN_NAME, 'transform_url')\
+            and not _is_token(tokens, i + 3, lexer.TOKEN_LPAREN)\
+            and not (previous is not None and previous.type == lexer.TOKEN_STRING):
+                #adjacent string literals are concatenated, so only
+                #fold a string which is not following another one
+                path, length = tokens[i].value, 3
+            elif _is_token(tokens, i, lexer.TOKEN_NAME, 'transform_url')\
+            and _is_token(tokens, i + 1, lexer.TOKEN_LPAREN)\
+            and _is_token(tokens, i + 2, lexer.TOKEN_STRING)\
+            and _is_token(tokens, i + 3, lexer.TOKEN_RPAREN)\
+            and not (previous is not None and previous.type in (lexer.TOKEN_DOT, lexer.TOKEN_PIPE)):
+                path, length = tokens[i + 2].value, 4
+            if path is None:
+                previous = tokens[i]
+                yield previous
+                i += 1
+                continue
+            lineno = tokens[i].lineno
+            yield lexer.Token(lineno, lexer.TOKEN_NAME, '_urli18n_precomputed')
+            yield lexer.Token(lineno, lexer.TOKEN_LPAREN, '(')
+            self._precompute(path)
+            yield lexer.Token(lineno, lexer.TOKEN_STRING, path)
+            previous = lexer.Token(lineno, lexer.TOKEN_RPAREN, ')')
+            yield previous
+            i += length
+
+def _is_token(tokens, index, token_type, value=None):
+    """Private helper function checking the type (and value)
+    of the token at ``index``."""
+    if index >= len(tokens):
+        return False
+    token = tokens[index]
+    return token.type == token_type and (value is None or token.value == value)
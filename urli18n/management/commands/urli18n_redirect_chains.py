@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+import sys
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from urli18n import diagnostics
+
+
+class Command(BaseCommand):
+    """Management command requesting a corpus of url's (one per line,
+    read from the given files or stdin) through all middleware classes
+    and reporting every url which is redirected twice or more before a
+    page is served. Usage:
+    
+    ::
+    
+        ./manage.py urli18n_redirect_chains urls.txt --accept-language=de
+    """
+    args = '[<file> ...]'
+    help = 'Reports the url\'s which are redirected more than once.'
+    option_list = BaseCommand.option_list + (
+        make_option('--accept-language', dest='accept_language', default=None,
+            help='The Accept-Language header of the requests.'),
+        make_option('--referer', dest='referer', default=None,
+            help='The Referer header of the requests, kept while following redirects like browsers do.'),
+        make_option('--min-hops', dest='min_hops', type='int', default=2,
+            help='The minimum number of redirects of a reported chain. Defaults to 2.'),
+        make_option('--max-hops', dest='max_hops', type='int', default=10,
+            help='The maximum number of redirects followed per url. Defaults to 10.'),
+    )
+    
+    def handle(self, *args, **options):
+        extra = {}
+        if options.get('accept_language'):
+            extra['HTTP_ACCEPT_LANGUAGE'] = options['accept_language']
+        if options.get('referer'):
+            extra['HTTP_REFERER'] = options['referer']
+        urls = []
+        if args:
+            for filename in args:
+                try:
+                    urls.extend(open(filename).read().splitlines())
+                except IOError, e:
+                    raise CommandError('Could not read %s: %s' % (filename, e))
+        else:
+            urls.extend(sys.stdin.read().splitlines())
+        urls = [url.strip() for url in urls if url.strip() and not url.strip().startswith('#')]
+        chains = diagnostics.find_redirect_chains(urls, options.get('min_hops') or 2,
+                                                  options.get('max_hops') or 10, **extra)
+        for hops in chains:
+            self.stdout.write('%s\n' % ' -> '.join(['%s (%s)' % (url, status or 'external') for url, status in hops]))
+        self.stdout.write('%d of %d url\'s redirected %d times or more.\n' % (
+            len(chains), len(urls), options.get('min_hops') or 2))
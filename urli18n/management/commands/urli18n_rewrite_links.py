@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import with_statement
+
+import time
+import difflib
+import multiprocessing
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import models
+from django.db import transaction
+from django.db import DEFAULT_DB_ALIAS
+
+from urli18n import utils
+
+
+class Command(BaseCommand):
+    """Management command rewriting the internal links of html stored in
+    the database, so visitors don't need to be redirected by the middleware.
+    The rows are read in chunks ordered by primary key, rewritten by a pool
+    of processes (see ``urli18n.utils.rewrite_links``) and written back
+    per chunk. Usage:
+    
+    ::
+    
+        ./manage.py urli18n_rewrite_links cms.Page body teaser --language=de --dry-run
+    """
+    args = '<app_label.ModelName> <field> [<field> ...]'
+    help = 'Rewrites the internal links of html stored in the given fields according to the activated middleware.'
+    option_list = BaseCommand.option_list + (
+        make_option('--language', dest='language', default=None,
+            help='The language the links are rewritten for. Defaults to LANGUAGE_CODE.'),
+        make_option('--language-field', dest='language_field', default=None,
+            help='A field of the model holding the language of each row, used instead of --language.'),
+        make_option('--chunk-size', dest='chunk_size', type='int', default=1000,
+            help='The number of rows read, rewritten and written at once. Defaults to 1000.'),
+        make_option('--processes', dest='processes', type='int', default=None,
+            help='The number of processes rewriting the rows. Defaults to the number of cores.'),
+        make_option('--dry-run', action='store_true', dest='dry_run', default=False,
+            help='Print a diff of the changes instead of saving them.'),
+        make_option('--database', dest='database', default=DEFAULT_DB_ALIAS,
+            help='The database to use. Defaults to the "default" database.'),
+    )
+    
+    def handle(self, *args, **options):
+        if len(args) < 2:
+            raise CommandError('Enter a model as app_label.ModelName and at least one field.')
+        try:
+            app_label, model_name = args[0].split('.')
+        except ValueError:
+            raise CommandError('Enter the model as app_label.ModelName.')
+        model = models.get_model(app_label, model_name)
+        if model is None:
+            raise CommandError('Unknown model: %s' % args[0])
+        fields = list(args[1:])
+        field_names = [field.name for field in model._meta.fields]
+        language_field = options.get('language_field')
+        for field in fields + (language_field and [language_field] or []):
+            if field not in field_names:
+                raise CommandError('Unknown field of %s: %s' % (args[0], field))
+        language = options.get('language') or settings.LANGUAGE_CODE
+        chunk_size = options.get('chunk_size') or 1000
+        processes = options.get('processes') or multiprocessing.cpu_count()
+        dry_run = options.get('dry_run')
+        using = options.get('database') or DEFAULT_DB_ALIAS
+        
+        queryset = model._default_manager.using(using).order_by('pk')
+        columns = ['pk'] + fields + (language_field and [language_field] or [])
+        start = time.time()
+        counts = {'rows': 0, 'changed': 0}
+        
+        def write(changed_rows):
+            if not dry_run:
+                with transaction.commit_on_success(using=using):
+                    for pk, changes in changed_rows:
+                        queryset.filter(pk=pk).update(**dict([(fields[index], new) for index, (old, new) in changes.items()]))
+            else:
+                for pk, changes in changed_rows:
+                    for index, (old, new) in sorted(changes.items()):
+                        label = '%s %s %s' % (args[0], pk, fields[index])
+                        diff = difflib.unified_diff(old.splitlines(), new.splitlines(),
+                                                    label, '%s (rewritten)' % label, lineterm='')
+                        self.stdout.write('%s\n' % '\n'.join(diff))
+            counts['changed'] += len(changed_rows)
+        
+        if processes > 1:
+            pool = multiprocessing.Pool(processes)
+        else:
+            pool = None
+        try:
+            #only the main process talks to the database, at most two
+            #chunks per process are in flight at the same time
+            pending = []
+            for rows in _iter_chunks(queryset, columns, chunk_size):
+                counts['rows'] += len(rows)
+                job = (rows, len(fields), language, bool(language_field))
+                if pool is None:
+                    write(_rewrite_rows(job))
+                    continue
+                pending.append(pool.apply_async(_rewrite_rows, (job,)))
+                if len(pending) >= processes * 2:
+                    write(pending.pop(0).get())
+            for result in pending:
+                write(result.get())
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+        
+        elapsed = max(time.time() - start, 0.000001)
+        self.stdout.write('%s%d of %d rows changed in %.2f seconds (%.0f rows/s).\n' % (
+            dry_run and '[dry-run] ' or '', counts['changed'], counts['rows'], elapsed, counts['rows'] / elapsed))
+
+def _iter_chunks(queryset, columns, chunk_size):
+    """Private generator function yielding the values of
+    ``columns`` in lists of ``chunk_size`` rows. The rows are
+    read by primary key ranges, so every chunk is one cheap
+    query regardless of the size of the table."""
+    last_pk = None
+    while True:
+        chunk_queryset = queryset
+        if last_pk is not None:
+            chunk_queryset = chunk_queryset.filter(pk__gt=last_pk)
+        rows = list(chunk_queryset.values_list(*columns)[:chunk_size])
+        if not rows:
+            break
+        yield rows
+        last_pk = rows[-1][0]
+        if len(rows) < chunk_size:
+            break
+
+def _rewrite_rows(job):
+    """Private function rewriting the links of one chunk of rows,
+    run in the worker processes. Returns the changed rows only, as
+    a list of ``(pk, {field index: (old, new)})`` tuples."""
+    rows, field_count, language, has_language_field = job
+    changed_rows = []
+    for row in rows:
+        row_language = language
+        if has_language_field and row[-1]:
+            row_language = row[-1]
+        changes = {}
+        for index in range(field_count):
+            old = row[index + 1]
+            if not old:
+                continue
+            new = utils.rewrite_links(old, row_language)
+            if new != old:
+                changes[index] = (old, new)
+        if changes:
+            changed_rows.append((row[0], changes))
+    return changed_rows
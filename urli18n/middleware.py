@@ -1,19 +1,209 @@
 # -*- coding: utf-8 -*-
 
-import re
+import urlparse
 
 from django.utils import translation
-from django.core import urlresolvers
+from django.utils.cache import patch_vary_headers
 from django import http
-from django import shortcuts
 from django.views.decorators.csrf import csrf_protect
 from django.conf import settings
 
 from urli18n import utils
+from urli18n import urls
 from urli18n import app_settings
 
 
-class UrlPathTransformMiddleware(object):
+class BaseTransformMiddleware(object):
+    """Base class for the middleware classes provided by urli18n,
+    used with the ``MIDDLEWARE_CLASSES`` setting. The middleware
+    classes can also be called as a callable wrapping ``get_response``
+    (the middleware protocol of Django 1.10 and later). This is
+    forward-looking only and untested with those Django versions.
+    """
+    
+    def __init__(self, get_response=None):
+        self.get_response = get_response
+    
+    def __call__(self, request):
+        response = self.process_request(request)
+        if response is None:
+            response = self.get_response(request)
+        return self.process_response(request, response)
+    
+    def activate_language(self, request, language):
+        """Activates ``language`` for the rest of the request and sets
+        ``request.LANGUAGE_CODE``. If ``URLI18N_SCOPE_LANGUAGE`` setting
+        is set to True the language activated before is remembered and
+        activated again by ``process_response``, so the language doesn't
+        leak into the next request served by the same thread. With
+        ``LocaleMiddleware`` nothing is remembered, since it deactivates
+        the language itself after stamping the ``Content-Language`` of
+        the response, which needs the language of the request.
+        
+        Args:
+            - ``request``: the django request object
+            - ``language``: the language shortcut to activate
+            
+        Returns:
+            - the activated language
+        """
+        if app_settings.URLI18N_SCOPE_LANGUAGE and not hasattr(request, 'urli18n_previous_language')\
+        and utils.LOCALE_MIDDLEWARE not in utils.get_middleware_classes():
+            request.urli18n_previous_language = translation.get_language()
+        if language != translation.get_language():
+            translation.activate(language)
+        request.LANGUAGE_CODE = translation.get_language()
+        return request.LANGUAGE_CODE
+    
+    def restore_language(self, request):
+        """Activates the language which was active before ``activate_language``
+        was called for ``request``, if ``URLI18N_SCOPE_LANGUAGE`` setting is set
+        to True. ``request.LANGUAGE_CODE`` keeps the language of the request.
+        
+        Args:
+            - ``request``: the django request object
+        """
+        previous_language = getattr(request, 'urli18n_previous_language', None)
+        if previous_language is not None:
+            translation.activate(previous_language)
+            del request.urli18n_previous_language
+    
+    def redirect_or_serve(self, request, location):
+        """Redirects a request without language to the url with the
+        language of ``location``. If ``URLI18N_SERVE_IN_PLACE`` setting
+        is set to True the view is rendered right away instead, and
+        ``process_response`` points to ``location`` as canonical url.
+        
+        Args:
+            - ``request``: the django request object
+            - ``location``: the url path with language
+            
+        Returns:
+            - Either a redirect response to ``location`` or None
+        """
+        if app_settings.URLI18N_SERVE_IN_PLACE:
+            request.urli18n_location = location
+            return None
+        return self.redirect(location, 'missing')
+    
+    def redirect(self, location, cause, language_in_url=False):
+        """Returns the redirect response to ``location``. The status
+        code is taken from ``URLI18N_REDIRECT_STATUS`` setting for the
+        ``cause`` of the redirect, the ``Cache-Control`` header from
+        ``URLI18N_REDIRECT_CACHE_CONTROL`` setting. The redirects vary on
+        ``Accept-Language`` and ``Cookie``, redirects of url's containing a
+        language also on ``Referer`` since they depend on the visitor
+        navigating on the site, see ``utils.redirect_vary_headers``.
+        
+        Args:
+            - ``location``: the url to redirect to
+            - ``cause``: ``'missing'`` (no language in the url), ``'switch'`` (another language in the url), ``'default'`` (the default language shouldn't be shown), ``'slash'`` (only the trailing slash is missing) or ``'canonical'`` (only the canonical query string is missing)
+            - ``language_in_url``: True if the requested url contains a language
+            
+        Returns:
+            - the redirect response
+        """
+        response = http.HttpResponseRedirect(location)
+        response.status_code = app_settings.URLI18N_REDIRECT_STATUS.get(cause, 302)
+        if app_settings.URLI18N_REDIRECT_CACHE_CONTROL is not None:
+            response['Cache-Control'] = app_settings.URLI18N_REDIRECT_CACHE_CONTROL
+        vary_headers = utils.redirect_vary_headers(cause, language_in_url)
+        if vary_headers:
+            patch_vary_headers(response, vary_headers)
+        return response
+    
+    def get_cached_response(self, request, language, path, querystring_parts):
+        """Looks up the page in the per-language page cache (see
+        ``URLI18N_PAGE_CACHE``). If it is not cached yet the response
+        is stored by ``process_response``.
+        
+        Args:
+            - ``request``: the django request object
+            - ``language``: the language of the page
+            - ``path``: the url path without language
+            - ``querystring_parts``: the query string parameters without language
+            
+        Returns:
+            - Either the cached response or None
+        """
+        cache = utils.get_page_cache()
+        if cache is None:
+            return None
+        key = utils.page_cache_key(request.get_host(), request.is_secure(), language, path, querystring_parts)
+        response = cache.get(key)
+        if response is None:
+            request.urli18n_page_cache_key = key
+        else:
+            request.urli18n_page_cache_hit = True
+        return response
+    
+    def process_response(self, request, response):
+        """Adds the ``Content-Location``, ``Link`` and ``Vary`` headers
+        to responses served in place (see ``redirect_or_serve``),
+        transforms the ``Location`` of ``APPEND_SLASH`` redirects and
+        of all other redirects to internal url path's
+        if ``URLI18N_REWRITE_REDIRECTS`` setting is set to True (see
+        ``urli18n.utils.transform_location``) and rewrites the internal links
+        of ``text/html`` responses if ``URLI18N_REWRITE_RESPONSE_LINKS``
+        setting is set to True (see ``urli18n.utils.LinkRewriter``). The
+        content of streaming responses is rewritten while it is sent.
+        Finally it stores the response in the page cache, see
+        ``get_cached_response``, and restores the language active
+        before the request, see ``activate_language``.
+        
+        Args:
+            - ``request``: the django request object
+            - ``response``: the django response object to process
+            
+        Returns:
+            - the response
+        """
+        if getattr(request, 'urli18n_page_cache_hit', False):
+            self.restore_language(request)
+            return response
+        location = getattr(request, 'urli18n_location', None)
+        if location is not None and 200 <= response.status_code < 300:
+            response['Content-Location'] = location
+            link = '<%s>; rel="canonical"' % request.build_absolute_uri(location)
+            if response.has_header('Link'):
+                link = '%s, %s' % (response['Link'], link)
+            response['Link'] = link
+            patch_vary_headers(response, ('Accept-Language', 'Cookie'))
+        if app_settings.URLI18N_REWRITE_REDIRECTS\
+        and response.status_code in (301, 302, 303, 307, 308)\
+        and response.has_header('Location'):
+            response['Location'] = utils.transform_location(response['Location'], request.get_host())
+        elif response.status_code == 301 and request.method == 'GET' and response.has_header('Location')\
+        and urlparse.urlsplit(response['Location'])[2] == request.path + '/':
+            #the APPEND_SLASH redirect of CommonMiddleware listed before
+            #this middleware, would be followed by another redirect
+            response['Location'] = utils.transform_location(response['Location'], request.get_host())
+        if app_settings.URLI18N_REWRITE_RESPONSE_LINKS\
+        and response.status_code not in (204, 304)\
+        and response.get('Content-Type', '').split(';')[0].strip() == 'text/html'\
+        and not response.has_header('Content-Encoding'):
+            rewriter = utils.LinkRewriter(budget=app_settings.URLI18N_REWRITE_RESPONSE_BUDGET)
+            if getattr(response, 'streaming', False):
+                response.streaming_content = rewriter.rewrite(response.streaming_content)
+            elif not getattr(response, '_is_string', True):
+                #iterator content of older Django versions
+                response._container = rewriter.rewrite(response._container)
+                if response.has_header('Content-Length'):
+                    del response['Content-Length']
+            else:
+                content = response.content
+                response.content = ''.join(rewriter.rewrite([content[i:i + 65536] for i in range(0, len(content), 65536)]))
+                if response.has_header('Content-Length'):
+                    response['Content-Length'] = str(len(response.content))
+        key = getattr(request, 'urli18n_page_cache_key', None)
+        if key is not None and utils.is_cacheable_response(response)\
+        and not utils.is_session_dependent(request):
+            utils.get_page_cache().set(key, response, app_settings.URLI18N_PAGE_CACHE_TIMEOUT)
+        self.restore_language(request)
+        return response
+
+
+class UrlPathTransformMiddleware(BaseTransformMiddleware):
     """A django middleware class which transforms
     the url path according to the current activated language.
     For example if current activated language is German the
@@ -38,7 +228,7 @@ class UrlPathTransformMiddleware(object):
         - Only processes ``GET`` request for url path's (as regular expressions) which are provided in ``URLI18N_INCLUDE_PATHS`` setting. If a path is provided in ``URLI18N_INCLUDE_PATHS`` setting it will transform the url, for all others the url will not be transformed (though the language will be changed)
         - If the url path does not start with a language prefix and it will build a new url from given path and redirect to it 
         - If ``URLI18N_ALWAYS_SHOW_LANGUAGE`` setting is set to True (the default) it will always show the language prefix in the url, if  ``URLI18N_ALWAYS_SHOW_LANGUAGE`` setting is set to False it will show the language prefix only for languages which are not the default language (set via the django setting for ``LANGUAGE_CODE``)
-        - If url path starts with a valid language prefix it will render the view attached to the given url in the original url conf. If will resolve other middleware classes ``process_request`` and ``process_view`` calls first to avoid conflicts
+        - If url path starts with a valid language prefix it will render the view attached to the given url in the original url conf. If will resolve other middleware classes ``process_request`` and ``process_view`` calls first to avoid conflicts. If ``URLI18N_DISPATCH_MODE`` setting is set to ``'path_info'`` it will only remove the language prefix from ``request.path_info`` and leave the rest to Django
         - If user is not navigating on the page but coming from a source which is not the domain of this project it will change the language directly when provided in the url or if not provided use the current activated language (given by process_request of django.middleware.locale.LocaleMiddleware)
         
         Args:
@@ -51,39 +241,70 @@ class UrlPathTransformMiddleware(object):
             path = request.path
             full_path = request.get_full_path()
             language = translation.get_language()
-            host = request.get_host()
-            redirect_to = None
-            regex_ref = re.compile('^http[s]?://%s' % host, re.UNICODE)
-            referer = request.META.get('HTTP_REFERER', None)
-            language_shortcuts = [lang[0] for lang in settings.LANGUAGES]
-            if utils.is_included_path(path) and utils.show_language(language):
+            #redirect to the final url in one step, including
+            #the slash CommonMiddleware would redirect to
+            slashed_path = utils.append_slash(path)
+            if utils.is_included_path(slashed_path) and utils.show_language(language):
                 #redirect to the url with the appropriate language shortcut
-                return shortcuts.redirect('/%s%s' % (language, full_path))
-            regex_prefix = re.compile('^/[-\w]+/')
-            language_from_path = regex_prefix.findall(path)
-            if language_from_path:
-                language_from_path = language_from_path[0].replace('/','')
-                if not referer or regex_ref.match(referer) is None:
-                    if language_from_path in language_shortcuts and language_from_path!=language:
-                        translation.activate(language_from_path)
-                        request.LANGUAGE_CODE = translation.get_language()
-                        language = translation.get_language()
-                if language_from_path in language_shortcuts and language_from_path!=language:
+                location = '/%s%s%s' % (language, slashed_path, full_path[len(path):])
+                if slashed_path != path:
+                    return self.redirect(location, 'missing')
+                return self.redirect_or_serve(request, location)
+            if app_settings.URLI18N_DISPATCH_MODE == 'urlconf':
+                #url path's with language prefix are resolved by the url conf,
+                #only the page cache is looked up before
+                if utils.get_page_cache() is None:
+                    return None
+                language_from_path = utils.get_language_prefix(path)
+                if language_from_path in utils.get_language_codes() and utils.show_language(language_from_path)\
+                and utils.is_included_path(path[len(language_from_path) + 1:]):
+                    response = self.get_cached_response(request, language_from_path, path[len(language_from_path) + 1:],
+                                                        request.META.get('QUERY_STRING', '').split('&'))
+                    if response is not None:
+                        #process_view isn't called for the cached response
+                        self.activate_language(request, language_from_path)
+                    return response
+                return None
+            language_from_path = utils.get_language_prefix(path)
+            if language_from_path is not None:
+                language_shortcuts = utils.get_language_codes()
+                if language_from_path in language_shortcuts and language_from_path!=language\
+                and not utils.is_internal_referer(request.META.get('HTTP_REFERER', None), request.get_host()):
+                    language = self.activate_language(request, language_from_path)
+                if language_from_path in language_shortcuts:
                     #cut of the language shortcut
-                    path = path.replace('/%s' % language_from_path, '', 1)
-                    full_path = full_path.replace('/%s' % language_from_path, '', 1)
+                    path = path[len(language_from_path) + 1:]
+                    full_path = full_path[len(language_from_path) + 1:]
+                    slashed_path = utils.append_slash(path)
+                    full_path = slashed_path + full_path[len(path):]
+                if language_from_path in language_shortcuts and (language_from_path!=language\
+                or not utils.show_language(language) or slashed_path != path):
                     #check if the path is_included_path
-                    if utils.is_included_path(path):
+                    if utils.is_included_path(slashed_path):
+                        if language_from_path != language:
+                            cause = 'switch'
+                        elif not utils.show_language(language):
+                            cause = 'default'
+                        else:
+                            cause = 'slash'
                         #redirect to the url with the appropriate language shortcut
                         if utils.show_language(language):
-                            return shortcuts.redirect('/%s%s' % (language, full_path))
+                            return self.redirect('/%s%s' % (language, full_path), cause, True)
                         else:
-                            return shortcuts.redirect('%s' % full_path)
-                elif language_from_path==language and utils.show_language(language):
-                    path = path.replace('/%s' % language_from_path, '', 1)
-                    full_path = full_path.replace('/%s' % language_from_path, '', 1)
+                            return self.redirect('%s' % full_path, cause, True)
+                elif language_from_path in language_shortcuts:
                     #check if the path is_included_path
                     if utils.is_included_path(path):
+                        response = self.get_cached_response(request, language, path,
+                                                            request.META.get('QUERY_STRING', '').split('&'))
+                        if response is not None:
+                            return response
+                        if self.get_response is not None\
+                        or app_settings.URLI18N_DISPATCH_MODE == 'path_info':
+                            #let django resolve the path without the
+                            #language shortcut and render the view
+                            request.path_info = request.path_info[len(language_from_path) + 1:]
+                            return None
                         #render the view
                         #all the other middleware's following this middleware in
                         #settings MIDDLEWARE_CLASSES still need to be
@@ -91,7 +312,7 @@ class UrlPathTransformMiddleware(object):
                         #of settings MIDDLEWARE_CLASSES process_view
                         #methods need to be processed as well before actually
                         #returning the view here
-                        view, args, kwargs = urlresolvers.resolve(path)
+                        view, args, kwargs = utils.resolve(path)
                         process_request_result = utils.process_missing_requests(self, request)
                         if process_request_result is not None:
                             return process_request_result
@@ -99,9 +320,39 @@ class UrlPathTransformMiddleware(object):
                         if process_request_view is not None:
                             return process_request_view
                         return view(request, *args, **kwargs)
+    
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        """Activates the language captured from the url path by a
+        url conf built with ``urli18n.urls.language_prefixed_urlpatterns``
+        and removes it from the view keyword arguments. Url path's which
+        are not included by ``URLI18N_INCLUDE_PATHS`` are not served with
+        language prefix, a ``Http404`` is raised for them. If the language
+        should not be shown in the url (see ``URLI18N_ALWAYS_SHOW_LANGUAGE``)
+        it will redirect to the path without the language prefix.
+        
+        Args:
+            - ``request``: the django request object to process
+            - ``view_func``: the view function which will be called
+            - ``view_args``: the view arguments
+            - ``view_kwargs``: the view keyword arguments, possibly containing the captured language
+            
+        Returns:
+            - Either a redirect response to the path without language prefix or None
+        """
+        language = view_kwargs.pop(urls.LANGUAGE_KWARG, None)
+        if language is not None:
+            #the page cache lookup of process_request checked the path already
+            if not hasattr(request, 'urli18n_page_cache_key')\
+            and not utils.is_included_path(request.path_info[len(language) + 1:]):
+                raise http.Http404('%s is not served with language prefix' % request.path_info)
+            if language != translation.get_language():
+                self.activate_language(request, language)
+            if request.method == 'GET' and not utils.show_language(language):
+                return self.redirect(request.get_full_path()[len(language) + 1:], 'default')
+        return None
             
 
-class UrlQuerystringTransformMiddleware(object):
+class UrlQuerystringTransformMiddleware(BaseTransformMiddleware):
     """A django middleware class which transforms
     the url's query string according to the current activated language.
     For example if current activated language is German the
@@ -140,28 +391,34 @@ class UrlQuerystringTransformMiddleware(object):
             - Either a redirect response to the right path with leading language shortcut or the view response for the view attached to the url of the path
         """
         path = request.path_info
-        if request.method == 'GET' and utils.is_included_path(path):
+        if request.method == 'GET':
+            #redirect to the final url in one step, including
+            #the slash CommonMiddleware would redirect to
+            slashed_path = utils.append_slash(path)
+        if request.method == 'GET' and utils.is_included_path(slashed_path):
             full_path = request.get_full_path()
             querystring_name = app_settings.URLI18N_QUERYSTRING_NAME
             
             path_parts, querystring_parts, language_querystring, language_querystring_position = utils.break_full_path(full_path)
+            if slashed_path != path:
+                path_parts[0] += '/'
+                full_path = utils.reconstruct_full_path(path_parts[0], querystring_parts)
+            if app_settings.URLI18N_CANONICAL_QUERYSTRING:
+                querystring_parts, language_querystring_position = utils.canonical_querystring(
+                    querystring_parts, language_querystring_position)
+                full_path = utils.reconstruct_full_path(path_parts[0], querystring_parts)
             
             language = translation.get_language()
-            host = request.get_host()
             redirect_to = None
-            regex_ref = re.compile('^http[s]?://%s' % host, re.UNICODE)
-            referer = request.META.get('HTTP_REFERER', None)
-            language_shortcuts = [lang[0] for lang in settings.LANGUAGES]
             
-            if not referer or regex_ref.match(referer) is None and language_querystring:
+            if language_querystring\
+            and not utils.is_internal_referer(request.META.get('HTTP_REFERER', None), request.get_host()):
                 #change the language according to the path if
                 #its provided in the path, else try to use the
                 #last activated language
                 language_from_querystring = language_querystring.replace('%s=' % querystring_name,'')
-                if language_from_querystring in language_shortcuts:
-                    translation.activate(language_from_querystring)
-                    request.LANGUAGE_CODE = translation.get_language()
-                    language = translation.get_language()
+                if language_from_querystring in utils.get_language_codes():
+                    language = self.activate_language(request, language_from_querystring)
             
             #reconstruct the language_querystring
             language_querystring = '%s=%s' % (querystring_name, language)
@@ -172,17 +429,61 @@ class UrlQuerystringTransformMiddleware(object):
                 if language_querystring_position is not None:
                     querystring_parts.pop(language_querystring_position)
                     full_path = utils.reconstruct_full_path(path_parts[0], querystring_parts)
+                    cause = 'default'
+                elif slashed_path != path:
+                    cause = 'slash'
+                else:
+                    cause = 'canonical'
                 if full_path != request.get_full_path():
-                    return shortcuts.redirect(full_path)
+                    return self.redirect(full_path, cause, language_querystring_position is not None)
             else:
                 if language_querystring_position is not None\
                 and language_querystring != querystring_parts[language_querystring_position]:
                     querystring_parts[language_querystring_position] = language_querystring
-                    redirect_to = utils.reconstruct_full_path(path_parts[0], querystring_parts)
+                    redirect_to, cause = utils.reconstruct_full_path(path_parts[0], querystring_parts), 'switch'
                 elif language_querystring_position is None:
                     querystring_parts.append(language_querystring)
-                    redirect_to = utils.reconstruct_full_path(path_parts[0], querystring_parts)
+                    redirect_to, cause = utils.reconstruct_full_path(path_parts[0], querystring_parts), 'missing'
+                    if slashed_path == path:
+                        return self.redirect_or_serve(request, redirect_to)
+                elif full_path != request.get_full_path():
+                    redirect_to, cause = full_path, slashed_path != path and 'slash' or 'canonical'
                 if redirect_to is not None:
-                    return shortcuts.redirect(redirect_to)
+                    return self.redirect(redirect_to, cause, language_querystring_position is not None)
+            return self.get_cached_response(request, language, slashed_path,
+                [part for i, part in enumerate(querystring_parts) if i != language_querystring_position])
+
+        
+
 
+class UrlHostTransformMiddleware(BaseTransformMiddleware):
+    """A django middleware class which activates the language
+    of the requested host, set via ``URLI18N_HOSTS`` setting. For
+    example with ``{'de': 'de.example.com', 'en': 'example.com'}``
+    the German version of the root url looks like this:
+    
+    ``http://de.example.com/``
+    
+    Url path's are never redirected or changed, so every language
+    can be cached on its own host. The template tags move links to
+    included url path's to the host of the language.
+    """
+    
+    def process_request(self, request):
+        """Activates the language of the requested host. Requests
+        for unknown hosts keep the active language (given by
+        process_request of django.middleware.locale.LocaleMiddleware).
         
+        Args:
+            - ``request``: the django request object to process
+            
+        Returns:
+            - Either the response from the page cache (see ``URLI18N_PAGE_CACHE``) or None
+        """
+        language = utils.get_host_language(request.get_host())
+        if language is not None:
+            self.activate_language(request, language)
+            if request.method == 'GET' and utils.is_included_path(request.path_info):
+                return self.get_cached_response(request, language, request.path_info,
+                                                request.META.get('QUERY_STRING', '').split('&'))
+        return None
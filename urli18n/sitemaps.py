@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+
+from django.conf import settings
+from django.contrib import sitemaps
+from django.contrib.sites.models import get_current_site
+from django.core import exceptions
+from django.core import paginator
+from django.core import urlresolvers
+from django.http import HttpResponse, Http404
+from django.utils import html
+from django.utils.encoding import smart_str
+
+from urli18n import utils
+
+try:
+    from django.http import StreamingHttpResponse
+except ImportError:
+    StreamingHttpResponse = None
+
+
+class I18nSitemap(sitemaps.Sitemap):
+    """Sitemap class which lists the location of every item once for
+    every language in ``settings.LANGUAGES``, annotated with
+    ``<xhtml:link rel="alternate" hreflang="...">`` links to the location
+    in all other languages. The locations are transformed according to
+    the activated middleware (see ``urli18n.utils.alternate_paths``), so
+    ``location`` should return the url path without language.
+    
+    Since every item results in one ``<url>`` entry per language, a page
+    of the sitemap contains ``limit // len(settings.LANGUAGES)`` items,
+    which keeps every page within the limit of 50000 urls. Use it together
+    with the ``index`` and ``sitemap`` views of this module, which are
+    streaming the xml instead of rendering it in memory:
+    
+    ::
+    
+        class BlogSitemap(I18nSitemap):
+            def items(self):
+                return Entry.objects.filter(is_draft=False)
+        
+        sitemaps = {'blog': BlogSitemap}
+        
+        urlpatterns = patterns('urli18n.sitemaps',
+            (r'^sitemap\.xml$', 'index', {'sitemaps': sitemaps}),
+            (r'^sitemap-(?P<section>.+)\.xml$', 'sitemap', {'sitemaps': sitemaps}),
+        )
+    """
+    
+    def _get(self, name, obj, default=None):
+        attr = getattr(self, name, default)
+        if callable(attr):
+            return attr(obj)
+        return attr
+    
+    def _get_paginator(self):
+        if not hasattr(self, '_paginator'):
+            per_page = max(1, self.limit // max(1, len(settings.LANGUAGES)))
+            self._paginator = paginator.Paginator(self.items(), per_page)
+        return self._paginator
+    paginator = property(_get_paginator)
+    
+    def iter_urls(self, page=1, site=None, protocol='http'):
+        """Generator yielding the url information of the
+        given page, one dictionary for every item and language.
+        
+        Args:
+            - ``page``: the page number of the sitemap
+            - ``site``: the ``Site`` or ``RequestSite`` used for the domain
+            - ``protocol``: the protocol of the locations
+        
+        Returns:
+            - a generator yielding dictionaries with ``location``, ``lastmod``,
+              ``changefreq``, ``priority`` and ``alternates`` (a list of
+              ``(language, location)`` tuples) keys
+        """
+        if site is None:
+            raise exceptions.ImproperlyConfigured('In order to use Sitemaps you must pass in a Site or RequestSite object.')
+        domain = '%s://%s' % (protocol, site.domain)
+        object_list = self.paginator.page(page).object_list
+        if hasattr(object_list, 'iterator'):
+            object_list = object_list.iterator()
+        for item in object_list:
+            path = utils.strip_language(self._get('location', item))
+            alternates = [(language, alternate.startswith('//') and '%s:%s' % (protocol, alternate) or domain + alternate)
+                          for language, alternate in utils.alternate_paths(path)]
+            priority = self._get('priority', item)
+            lastmod = self._get('lastmod', item)
+            changefreq = self._get('changefreq', item)
+            for language, location in alternates:
+                yield {
+                    'location': location,
+                    'lastmod': lastmod,
+                    'changefreq': changefreq,
+                    'priority': str(priority is not None and priority or ''),
+                    'alternates': alternates,
+                }
+    
+    def get_urls(self, page=1, site=None):
+        return list(self.iter_urls(page, site))
+
+
+def index(request, sitemaps, sitemap_url_name='urli18n.sitemaps.sitemap'):
+    """View streaming a sitemap index, listing every page of
+    the given sitemaps. Use it with ``urli18n.sitemaps.sitemap``
+    or pass the url name of your sitemap view.
+    
+    Args:
+        - ``request``: the current request
+        - ``sitemaps``: dictionary of section names and sitemap classes or instances
+        - ``sitemap_url_name``: the url name of the sitemap view, reversed with ``section``
+    """
+    current_site = get_current_site(request)
+    protocol = request.is_secure() and 'https' or 'http'
+    locations = []
+    for section, site in sitemaps.items():
+        if callable(site):
+            site = site()
+        sitemap_url = urlresolvers.reverse(sitemap_url_name, kwargs={'section': section})
+        location = '%s://%s%s' % (protocol, current_site.domain, sitemap_url)
+        locations.append(location)
+        for page in range(2, site.paginator.num_pages + 1):
+            locations.append('%s?p=%s' % (location, page))
+    return _streaming_response(_iter_index_xml, locations)
+
+def sitemap(request, sitemaps, section=None):
+    """View streaming the ``<url>`` entries of one page of the given sitemaps
+    (or only the one of ``section``), including the ``xhtml:link`` alternates
+    of ``I18nSitemap`` classes. The page is taken from the ``p`` query string
+    parameter.
+    
+    Args:
+        - ``request``: the current request
+        - ``sitemaps``: dictionary of section names and sitemap classes or instances
+        - ``section``: the section name of the sitemap to show
+    """
+    if section is not None:
+        if section not in sitemaps:
+            raise Http404('No sitemap available for section: %r' % section)
+        maps = [sitemaps[section]]
+    else:
+        maps = sitemaps.values()
+    page = request.GET.get('p', 1)
+    current_site = get_current_site(request)
+    protocol = request.is_secure() and 'https' or 'http'
+    url_sources = []
+    for site in maps:
+        if callable(site):
+            site = site()
+        #validate the page before the response starts streaming
+        try:
+            site.paginator.validate_number(page)
+        except paginator.EmptyPage:
+            raise Http404('Page %s empty' % page)
+        except paginator.PageNotAnInteger:
+            raise Http404("No page '%s'" % page)
+        url_sources.append(site)
+    return _streaming_response(_iter_urlset_xml, url_sources, page, current_site, protocol)
+
+def _streaming_response(function, *args):
+    """Private helper function returning a response which
+    generates its content with the generator function ``function``
+    only while it is sent. Older Django versions don't have streaming
+    responses, there the content is wrapped in a ``ReiterableContent``,
+    so middleware classes reading ``response.content`` (for example
+    ``ConditionalGetMiddleware``) don't exhaust it."""
+    if StreamingHttpResponse is not None:
+        return StreamingHttpResponse(function(*args), content_type='application/xml')
+    return HttpResponse(ReiterableContent(function, *args), content_type='application/xml')
+
+def _iter_index_xml(locations):
+    """Private generator function yielding the xml of a sitemap index."""
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">\n'
+    for location in locations:
+        yield '<sitemap><loc>%s</loc></sitemap>\n' % smart_str(html.escape(location))
+    yield '</sitemapindex>\n'
+
+def _iter_urlset_xml(sites, page, current_site, protocol):
+    """Private generator function yielding the xml of a sitemap,
+    one ``<url>`` entry at a time."""
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9" xmlns:xhtml="http://www.w3.org/1999/xhtml">\n'
+    for site in sites:
+        if isinstance(site, I18nSitemap):
+            urls = site.iter_urls(page, current_site, protocol)
+        else:
+            urls = site.get_urls(page=page, site=current_site)
+        for url in urls:
+            parts = ['<url><loc>%s</loc>' % html.escape(url['location'])]
+            if url.get('lastmod'):
+                parts.append('<lastmod>%s</lastmod>' % url['lastmod'].strftime('%Y-%m-%d'))
+            if url.get('changefreq'):
+                parts.append('<changefreq>%s</changefreq>' % html.escape(url['changefreq']))
+            if url.get('priority'):
+                parts.append('<priority>%s</priority>' % html.escape(url['priority']))
+            for language, location in url.get('alternates', ()):
+                parts.append('<xhtml:link rel="alternate" hreflang="%s" href="%s"/>'
+                             % (html.escape(language), html.escape(location)))
+            parts.append('</url>\n')
+            yield smart_str(''.join(parts))
+    yield '</urlset>\n'
+
+
+class ReiterableContent(object):
+    """Content of a response which is generated by calling the generator
+    function ``function`` with ``args`` every time it is iterated. Unlike
+    a generator it can be iterated more than once, so it is safe to use
+    as the content of a ``HttpResponse`` in Django versions without
+    ``StreamingHttpResponse``.
+    """
+    
+    def __init__(self, function, *args):
+        self.function = function
+        self.args = args
+    
+    def __iter__(self):
+        return self.function(*self.args)
@@ -1,8 +1,15 @@
 # -*- coding: utf-8 -*-
 
+import re
+
 from django import template
+from django.core import urlresolvers
+from django.utils import translation
+from django.utils import html
+from django.utils import safestring
 
 from urli18n import utils
+from urli18n import app_settings
 
 
 register = template.Library()
@@ -13,13 +20,152 @@ def transform_url(path):
     for more information.
     """
     return utils.transform_path(path)
-register.simple_tag(transform_url)
+
+
+class TransformUrlNode(template.Node):
+    """Template node of the ``transform_url`` tag. If the path
+    is a string literal it is transformed for all languages when the
+    template is compiled. Other url path's are memoized within the
+    render context of the template, keyed by path, active language
+    and middleware mode, so repeated links are transformed only once
+    per render.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self.precomputed_path = None
+        if isinstance(path.var, basestring) and not path.filters:
+            self.precomputed_path = utils.PrecomputedPath(path.var)
+        
+    def render(self, context):
+        if self.precomputed_path is not None:
+            return self.precomputed_path.get()
+        path = self.path.resolve(context)
+        if not isinstance(path, basestring):
+            return utils.transform_path(path)
+        memo = context.render_context.get(self.__class__)
+        if memo is None:
+            memo = context.render_context[self.__class__] = {}
+        key = (path, translation.get_language(), utils.get_middleware_mode())
+        transformed_path = memo.get(key)
+        if transformed_path is None:
+            transformed_path = memo[key] = utils.transform_path(path)
+        return transformed_path
+
+def do_transform_url(parser, token):
+    """Transforms the url path according to
+    acitivated Middleware. See ``urli18n.utils.transform_path``
+    for more information.
+    
+    Usage::
+        
+        {% transform_url '/blog/' %}
+        {% transform_url blog_url %}
+    """
+    bits = token.split_contents()
+    if len(bits) != 2:
+        raise template.TemplateSyntaxError("'%s' takes exactly one argument" % bits[0])
+    return TransformUrlNode(parser.compile_filter(bits[1]))
+register.tag('transform_url', do_transform_url)
 
 def transform_url_filter(path):
     """Transforms the url path according to
     acitivated Middleware. See ``urli18n.utils.transform_path``
     for more information.
+    
+    Filters have no access to the render context, so the results
+    are memoized process wide instead, see
+    ``urli18n.utils.cached_transform_path``.
     """
-    return utils.transform_path(path)
+    return utils.cached_transform_path(path)
 register.filter('transform_url', transform_url_filter)
+
+
+class I18nUrlNode(template.Node):
+    """Template node of the ``i18n_url`` tag."""
+    
+    def __init__(self, viewname, args, kwargs, asvar):
+        self.viewname = viewname
+        self.args = args
+        self.kwargs = kwargs
+        self.asvar = asvar
+        
+    def render(self, context):
+        args = [arg.resolve(context) for arg in self.args]
+        kwargs = dict([(str(k), v.resolve(context)) for k, v in self.kwargs.items()])
+        try:
+            url = utils.reverse(self.viewname.resolve(context), args=args, kwargs=kwargs,
+                                current_app=context.current_app)
+        except urlresolvers.NoReverseMatch:
+            if self.asvar is None:
+                raise
+            url = ''
+        if self.asvar is not None:
+            context[self.asvar] = url
+            return ''
+        return url
+
+kwarg_re = re.compile(r"(?:(\w+)=)?(.+)")
+
+def do_i18n_url(parser, token):
+    """Returns the url of a view transformed according to the
+    activated language and middleware, like using the ``url`` tag
+    followed by the ``transform_url`` tag. See ``urli18n.utils.reverse``
+    for more information. The view name is a variable or a quoted string.
+    
+    Usage::
         
+        {% i18n_url 'blog_entry' entry.year entry.slug %}
+        {% i18n_url 'blog_entry' year=entry.year slug=entry.slug as entry_url %}
+    """
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError("'%s' takes at least one argument (path to a view)" % bits[0])
+    viewname = parser.compile_filter(bits[1])
+    asvar = None
+    bits = bits[2:]
+    if len(bits) >= 2 and bits[-2] == 'as':
+        asvar = bits[-1]
+        bits = bits[:-2]
+    args = []
+    kwargs = {}
+    for bit in bits:
+        name, value = kwarg_re.match(bit).groups()
+        if name:
+            kwargs[name] = parser.compile_filter(value)
+        else:
+            args.append(parser.compile_filter(value))
+    return I18nUrlNode(viewname, args, kwargs, asvar)
+register.tag('i18n_url', do_i18n_url)
+
+def urli18n_alternates(context):
+    """Renders a ``<link rel="alternate" hreflang="...">`` tag
+    for every language in ``settings.LANGUAGES``, pointing to the
+    current url path transformed for this language. Nothing is
+    rendered if the path is not included by ``URLI18N_INCLUDE_PATHS``.
+    The links are kept in the ``'alternates'`` LRU cache (see
+    ``URLI18N_ALTERNATES_CACHE_SIZE``), since they are the same for
+    every visitor of a page. Needs the ``request`` in the context.
+    
+    Usage::
+        
+        {% urli18n_alternates %}
+    """
+    request = context.get('request')
+    if request is None:
+        return ''
+    full_path = utils.strip_language(request.get_full_path())
+    key = (request.is_secure(), request.get_host(), full_path,
+           utils.get_transform_settings(), utils.get_language_codes())
+    cache = utils.get_lru_cache('alternates', app_settings.URLI18N_ALTERNATES_CACHE_SIZE)
+    alternates = cache.get(key)
+    if alternates is None:
+        links = []
+        if utils.is_included_path(full_path):
+            for language, path in utils.alternate_paths(full_path):
+                links.append('<link rel="alternate" hreflang="%s" href="%s" />'
+                             % (html.escape(language), html.escape(request.build_absolute_uri(path))))
+        alternates = safestring.mark_safe('\n'.join(links))
+        cache.set(key, alternates)
+    return alternates
+register.simple_tag(takes_context=True)(urli18n_alternates)
@@ -1,11 +1,40 @@
 # -*- coding: utf-8 -*-
 
+import re
+import shutil
+import tempfile
+import StringIO
+import sys
+import threading
+
+from django import http
+from django import template
 from django.test import TestCase
+from django.test import client
+from django.utils import unittest
 from django.utils import translation
+from django.utils.cache import patch_vary_headers
+from django.utils.importlib import import_module
+from django.core import urlresolvers
+from django.core import management
+from django.core.cache import cache
+from django.contrib.auth.models import Group
 from django.conf import settings
 
 from urli18n import app_settings
+from urli18n import middleware
+from urli18n import sitemaps
+from urli18n import diagnostics
+from urli18n import wsgi
+from urli18n import urls as urli18n_urls
+from urli18n import utils
 from urli18n.templatetags import urli18n_tags
+from urli18n.tests import urls as test_urls
+
+try:
+    import jinja2
+except ImportError:
+    jinja2 = None
 
 
 class UrlPathTransformMiddlewareTestCase(TestCase):
@@ -30,6 +59,16 @@ class UrlPathTransformMiddlewareTestCase(TestCase):
                                '^/articles/(?P<year>\d{4})/(?P<month>\d{2})/(?P<day>\d+)/$']
         app_settings.URLI18N_INCLUDE_PATHS = self.included_paths
         app_settings.URLI18N_ALWAYS_SHOW_LANGUAGE = True
+        self.curr_app_URLI18N_DISPATCH_MODE = app_settings.URLI18N_DISPATCH_MODE
+        self.curr_app_URLI18N_RESOLVE_CACHE_SIZE = app_settings.URLI18N_RESOLVE_CACHE_SIZE
+        self.curr_app_URLI18N_REWRITE_RESPONSE_LINKS = app_settings.URLI18N_REWRITE_RESPONSE_LINKS
+        self.curr_app_URLI18N_REWRITE_RESPONSE_BUDGET = app_settings.URLI18N_REWRITE_RESPONSE_BUDGET
+        self.curr_app_URLI18N_REWRITE_REDIRECTS = app_settings.URLI18N_REWRITE_REDIRECTS
+        self.curr_app_URLI18N_SERVE_IN_PLACE = app_settings.URLI18N_SERVE_IN_PLACE
+        self.curr_app_URLI18N_REDIRECT_STATUS = app_settings.URLI18N_REDIRECT_STATUS
+        self.curr_app_URLI18N_REDIRECT_CACHE_CONTROL = app_settings.URLI18N_REDIRECT_CACHE_CONTROL
+        self.curr_app_URLI18N_PAGE_CACHE = app_settings.URLI18N_PAGE_CACHE
+        self.curr_app_URLI18N_SCOPE_LANGUAGE = app_settings.URLI18N_SCOPE_LANGUAGE
     
     def tearDown(self):
         settings.MIDDLEWARE_CLASSES = self.curr_MIDDLEWARE_CLASSES
@@ -37,6 +76,18 @@ class UrlPathTransformMiddlewareTestCase(TestCase):
         settings.LANGUAGES = self.curr_LANGUAGES
         app_settings.URLI18N_INCLUDE_PATHS = self.curr_app_URLI18N_INCLUDE_PATHS
         app_settings.URLI18N_ALWAYS_SHOW_LANGUAGE = self.curr_app_URLI18N_ALWAYS_SHOW_LANGUAGE
+        app_settings.URLI18N_REDIRECT_STATUS = self.curr_app_URLI18N_REDIRECT_STATUS
+        app_settings.URLI18N_REDIRECT_CACHE_CONTROL = self.curr_app_URLI18N_REDIRECT_CACHE_CONTROL
+        app_settings.URLI18N_PAGE_CACHE = self.curr_app_URLI18N_PAGE_CACHE
+        app_settings.URLI18N_SCOPE_LANGUAGE = self.curr_app_URLI18N_SCOPE_LANGUAGE
+        cache.clear()
+        app_settings.URLI18N_DISPATCH_MODE = self.curr_app_URLI18N_DISPATCH_MODE
+        app_settings.URLI18N_RESOLVE_CACHE_SIZE = self.curr_app_URLI18N_RESOLVE_CACHE_SIZE
+        app_settings.URLI18N_REWRITE_RESPONSE_LINKS = self.curr_app_URLI18N_REWRITE_RESPONSE_LINKS
+        app_settings.URLI18N_REWRITE_RESPONSE_BUDGET = self.curr_app_URLI18N_REWRITE_RESPONSE_BUDGET
+        app_settings.URLI18N_REWRITE_REDIRECTS = self.curr_app_URLI18N_REWRITE_REDIRECTS
+        app_settings.URLI18N_SERVE_IN_PLACE = self.curr_app_URLI18N_SERVE_IN_PLACE
+        utils.clear_caches()
 
     def test_view1_en(self):
         #first with standard settings
@@ -265,6 +316,91 @@ class UrlPathTransformMiddlewareTestCase(TestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(translation.get_language(), 'zh-cn')
         
+    def test_middleware_pipeline_built_once(self):
+        settings.MIDDLEWARE_CLASSES = (
+            'django.contrib.sessions.middleware.SessionMiddleware',
+            'urli18n.middleware.UrlPathTransformMiddleware',
+            'django.middleware.common.CommonMiddleware',
+        )
+        translation.activate('en')
+        response = self.client.get('/en/home/')
+        self.assertEqual(response.status_code, 200)
+        instance_count = utils.middleware_instance_count
+        for path in ('/en/home/', '/en/articles/2011/01/', '/en/'):
+            response = self.client.get(path)
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(utils.middleware_instance_count, instance_count)
+        
+    def test_path_info_dispatch_mode(self):
+        app_settings.URLI18N_DISPATCH_MODE = 'path_info'
+        settings.MIDDLEWARE_CLASSES = (
+            'urli18n.middleware.UrlPathTransformMiddleware',
+            'django.middleware.common.CommonMiddleware',
+        )
+        translation.activate('de')
+        response = self.client.get('/articles/2011/01/')
+        self.assertRedirects(response, '/de/articles/2011/01/')
+        response = self.client.get('/de/articles/2011/01/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, '2011-01')
+        self.assertEqual(response.request['PATH_INFO'], '/de/articles/2011/01/')
+        response = self.client.get('/zh-cn/articles/2011/02/28/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(translation.get_language(), 'zh-cn')
+        self.assertEqual(response.content, '2011-02-28')
+        
+    def test_new_style_middleware(self):
+        requests = []
+        def get_response(request):
+            requests.append(request)
+            return http.HttpResponse()
+        middleware_object = middleware.UrlPathTransformMiddleware(get_response)
+        factory = client.RequestFactory()
+        translation.activate('de')
+        response = middleware_object(factory.get('/home/'))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(requests, [])
+        response = middleware_object(factory.get('/de/home/'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(requests[0].path_info, '/home/')
+        self.assertEqual(requests[0].path, '/de/home/')
+        
+    def test_resolve_cache(self):
+        app_settings.URLI18N_RESOLVE_CACHE_SIZE = 2
+        translation.activate('en')
+        for path in ('/en/home/', '/en/home/', '/en/articles/2011/01/', '/en/articles/2011/01/'):
+            response = self.client.get(path)
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, '2011-01')
+        info = utils.cache_info('resolve')
+        self.assertEqual((info['hits'], info['misses'], info['evictions']), (2, 2, 0))
+        response = self.client.get('/en/articles/2011/02/28/')
+        self.assertEqual(response.content, '2011-02-28')
+        info = utils.cache_info('resolve')
+        self.assertEqual((info['size'], info['evictions']), (2, 1))
+        #reloading the url conf invalidates the cached results
+        urlresolvers.clear_url_caches()
+        response = self.client.get('/en/articles/2011/02/28/')
+        self.assertEqual(response.content, '2011-02-28')
+        self.assertEqual(utils.cache_info('resolve')['hits'], 2)
+        
+    def test_referer(self):
+        translation.activate('en')
+        #navigating on the site keeps the activated language
+        response = self.client.get('/de/home/', HTTP_REFERER='http://testserver/en/')
+        self.assertRedirects(response, '/en/home/')
+        #coming from another site activates the language from the path
+        response = self.client.get('/de/home/', HTTP_REFERER='http://testserver.example.com/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(translation.get_language(), 'de')
+        
+    def test_long_language_code(self):
+        settings.LANGUAGES = settings.LANGUAGES + (('sr-latn', 'Srpski (latinica)'),)
+        translation.activate('en')
+        response = self.client.get('/sr-latn/home/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(translation.get_language(), 'sr-latn')
+        
     def test_template_tag(self):
         translation.activate('en')
         path = urli18n_tags.transform_url('/')
@@ -312,6 +448,445 @@ class UrlPathTransformMiddlewareTestCase(TestCase):
         path = urli18n_tags.transform_url('/zh-cn')
         self.assertEqual(path, '/zh-cn')
         
+    def test_template_rendering(self):
+        transformed_paths = []
+        def transform_path(path, language=None):
+            transformed_paths.append(path)
+            return self.transform_path(path, language)
+        self.transform_path, utils.transform_path = utils.transform_path, transform_path
+        try:
+            translation.activate('de')
+            t = template.Template("{% load urli18n_tags %}"
+                                  "{% for path in paths %}{% transform_url path %} {{ path|transform_url }} {% endfor %}")
+            output = t.render(template.Context({'paths': ['/home/', '/', '/home/', '/home/']}))
+            self.assertEqual(output, '/de/home/ /de/home/ /de/ /de/ /de/home/ /de/home/ /de/home/ /de/home/ ')
+            #once for the tag and once for the filter
+            self.assertEqual(transformed_paths, ['/home/', '/home/', '/', '/'])
+            translation.activate('zh-cn')
+            output = t.render(template.Context({'paths': ['/home/']}))
+            self.assertEqual(output, '/zh-cn/home/ /zh-cn/home/ ')
+        finally:
+            utils.transform_path = self.transform_path
+            
+    def test_template_tag_literal(self):
+        t = template.Template("{% load urli18n_tags %}{% transform_url '/home/' %} {% transform_url '/unknown/' %}")
+        node = t.nodelist[-1]
+        self.assertEqual(node.precomputed_path._state[2], {'en': '/en/unknown/', 'de': '/de/unknown/', 'zh-cn': '/zh-cn/unknown/'})
+        translation.activate('de')
+        self.assertEqual(t.render(template.Context()), '/de/home/ /de/unknown/')
+        translation.activate('zh-cn')
+        self.assertEqual(t.render(template.Context()), '/zh-cn/home/ /zh-cn/unknown/')
+        #changed settings are considered
+        app_settings.URLI18N_INCLUDE_PATHS = ['/home']
+        self.assertEqual(t.render(template.Context()), '/zh-cn/home/ /unknown/')
+        
+    def test_reverse(self):
+        translation.activate('en')
+        self.assertEqual(utils.reverse('urli18n.tests.views.view3', args=['2011', '01']), '/en/articles/2011/01/')
+        self.assertEqual(utils.reverse('urli18n.tests.views.view3', args=['2011', '01'], language='de'), '/de/articles/2011/01/')
+        self.assertEqual(utils.reverse('urli18n.tests.views.view3', args=['2011', '01']), '/en/articles/2011/01/')
+        info = utils.cache_info('reverse')
+        self.assertEqual((info['hits'], info['misses']), (1, 2))
+        app_settings.URLI18N_ALWAYS_SHOW_LANGUAGE = False
+        self.assertEqual(utils.reverse('urli18n.tests.views.view3', args=['2011', '01']), '/articles/2011/01/')
+        
+    def test_i18n_url_tag(self):
+        translation.activate('de')
+        t = template.Template("{% load urli18n_tags %}"
+                              "{% i18n_url 'urli18n.tests.views.view2' %} "
+                              "{% i18n_url view year=year month=month day='28' %} "
+                              "{% i18n_url 'unknown' as url %}{{ url }}")
+        output = t.render(template.Context({'view': 'urli18n.tests.views.view4', 'year': 2011, 'month': '02'}))
+        self.assertEqual(output, '/de/home/ /de/articles/2011/02/28/ ')
+        
+    def test_transform_paths(self):
+        translation.activate('en')
+        paths = ['/', '/home/', '/de/home/', '/articles/2011/01/', '/media/image.png', '/unknown/']
+        transformed = utils.transform_paths(paths, language='de')
+        translation.activate('zh-cn')
+        self.assertEqual(list(transformed), [utils.transform_path(path, 'de') for path in paths])
+        self.assertEqual(translation.get_language(), 'zh-cn')
+        self.assertEqual(list(utils.transform_paths(iter(['/home/']))), ['/zh-cn/home/'])
+        app_settings.URLI18N_ALWAYS_SHOW_LANGUAGE = False
+        self.assertEqual(list(utils.transform_paths(paths, language='en')), paths)
+        
+    def test_rewrite_links(self):
+        content = ('<a href="/home/">Home</a> <a href=\'/de/home/\'>Start</a> <a href="/media/image.png">x</a> '
+                   '<a href="http://example.com/home/">x</a> <a href="//example.com/home/">x</a> '
+                   '<img src="/home/"> <form action="/articles/2011/01/">')
+        self.assertEqual(utils.rewrite_links(content, 'de'),
+                         '<a href="/de/home/">Home</a> <a href=\'/de/home/\'>Start</a> <a href="/media/image.png">x</a> '
+                         '<a href="http://example.com/home/">x</a> <a href="//example.com/home/">x</a> '
+                         '<img src="/home/"> <form action="/de/articles/2011/01/">')
+        self.assertEqual(utils.rewrite_links('no links', 'de'), 'no links')
+        #links to other languages and to path's which are not strictly included are kept
+        content = '<a href="/de/home/">Deutsch</a> <a href="/login/?u=x">x</a> <a href="/home/?page=2#top">x</a>'
+        self.assertEqual(utils.rewrite_links(content, 'en'),
+                         '<a href="/de/home/">Deutsch</a> <a href="/login/?u=x">x</a> <a href="/en/home/?page=2#top">x</a>')
+        
+    def test_rewrite_links_command(self):
+        Group.objects.create(name='<a href="/home/">Home</a>')
+        Group.objects.create(name='<a href="/de/home/">Start</a>')
+        Group.objects.create(name='<a href="/">Start</a>')
+        #links to another language and to path's which are not included are kept
+        Group.objects.create(name='<a href="/zh-cn/home/">Chinese</a> <a href="/login/?u=x">Login</a>')
+        stdout = StringIO.StringIO()
+        management.call_command('urli18n_rewrite_links', 'auth.Group', 'name', language='de',
+                                dry_run=True, processes=1, chunk_size=2, stdout=stdout)
+        output = stdout.getvalue()
+        self.assertTrue('-<a href="/home/">Home</a>\n+<a href="/de/home/">Home</a>\n' in output)
+        self.assertTrue('[dry-run] 2 of 4 rows changed' in output)
+        self.assertEqual(Group.objects.filter(name__contains='/de/').count(), 1)
+        management.call_command('urli18n_rewrite_links', 'auth.Group', 'name', language='de',
+                                processes=1, chunk_size=2, stdout=StringIO.StringIO())
+        self.assertEqual(sorted(Group.objects.values_list('name', flat=True)),
+                         ['<a href="/de/">Start</a>', '<a href="/de/home/">Home</a>', '<a href="/de/home/">Start</a>',
+                          '<a href="/zh-cn/home/">Chinese</a> <a href="/login/?u=x">Login</a>'])
+        
+    def test_redirect_status(self):
+        translation.activate('en')
+        response = self.client.get('/home/')
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(response.has_header('Cache-Control'))
+        app_settings.URLI18N_REDIRECT_STATUS = dict(app_settings.URLI18N_REDIRECT_STATUS, missing=301, default=307)
+        app_settings.URLI18N_REDIRECT_CACHE_CONTROL = 'max-age=60'
+        response = self.client.get('/home/')
+        self.assertEqual(response.status_code, 301)
+        self.assertEqual(response['Location'], 'http://testserver/en/home/')
+        self.assertEqual(response['Cache-Control'], 'max-age=60')
+        self.assertEqual(response['Vary'], 'Accept-Language, Cookie')
+        app_settings.URLI18N_ALWAYS_SHOW_LANGUAGE = False
+        translation.activate('en')
+        response = self.client.get('/en/home/')
+        self.assertEqual(response.status_code, 307)
+        self.assertEqual(response['Location'], 'http://testserver/home/')
+        self.assertEqual(response['Vary'], 'Accept-Language, Cookie, Referer')
+        
+    def test_redirect_vary(self):
+        #the slash redirect of a url with language depends on the referer
+        settings.MIDDLEWARE_CLASSES = (
+            'django.middleware.common.CommonMiddleware',
+            'django.middleware.locale.LocaleMiddleware',
+            'urli18n.middleware.UrlPathTransformMiddleware',
+        )
+        response = self.client.get('/de/home', HTTP_ACCEPT_LANGUAGE='de')
+        self.assertEqual(response.status_code, 301)
+        self.assertEqual(response['Location'], 'http://testserver/de/home/')
+        self.assertEqual(response['Vary'], 'Accept-Language, Cookie, Referer')
+        response = self.client.get('/de/home', HTTP_ACCEPT_LANGUAGE='en', HTTP_REFERER='http://testserver/en/')
+        self.assertEqual(response['Location'], 'http://testserver/en/home/')
+        self.assertEqual(response['Vary'], 'Accept-Language, Cookie, Referer')
+        redirect = wsgi.get_redirect(client.RequestFactory().get('/de/home').environ)
+        self.assertEqual(utils.redirect_vary_headers(*redirect[1:]), ('Accept-Language', 'Cookie', 'Referer'))
+        
+    def test_page_cache(self):
+        app_settings.URLI18N_PAGE_CACHE = 'default'
+        translation.activate('de')
+        response = self.client.get('/de/articles/2011/01/', {'b': '2', 'a': '1'})
+        self.assertEqual(response.content, '2011-01')
+        key = utils.page_cache_key('testserver', False, 'de', '/articles/2011/01/', ['a=1', 'b=2'])
+        self.assertEqual(cache.get(key).content, '2011-01')
+        #the cached response is served without resolving the view
+        cache.set(key, http.HttpResponse('cached'))
+        response = self.client.get('/de/articles/2011/01/?a=1&b=2')
+        self.assertEqual(response.content, 'cached')
+        #other languages have their own entries
+        response = self.client.get('/zh-cn/articles/2011/01/', {'b': '2', 'a': '1'})
+        self.assertEqual(response.content, '2011-01')
+        #responses depending on the session are not cached, although
+        #SessionMiddleware adds Vary: Cookie only after this middleware
+        settings.MIDDLEWARE_CLASSES = (
+            'django.contrib.sessions.middleware.SessionMiddleware',
+            'django.middleware.locale.LocaleMiddleware',
+            'django.contrib.auth.middleware.AuthenticationMiddleware',
+            'urli18n.middleware.UrlPathTransformMiddleware',
+        )
+        app_settings.URLI18N_INCLUDE_PATHS = self.included_paths + ['/who/']
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session['user'] = 'alice'
+        session.save()
+        alice = client.Client()
+        alice.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+        response = alice.get('/en/who/')
+        self.assertEqual(response.content, 'user=alice')
+        response = client.Client().get('/en/who/')
+        self.assertEqual(response.content, 'user=')
+        self.assertEqual(cache.get(utils.page_cache_key('testserver', False, 'en', '/who/', [''])), None)
+        #responses setting or varying on cookies are not cached
+        response = http.HttpResponse()
+        response.set_cookie('name', 'value')
+        self.assertFalse(utils.is_cacheable_response(response))
+        response = http.HttpResponse()
+        response['Vary'] = 'Accept-Encoding, Cookie'
+        self.assertFalse(utils.is_cacheable_response(response))
+        response['Vary'] = 'Accept-Language'
+        self.assertTrue(utils.is_cacheable_response(response))
+        #responses varying on other request headers are not cached
+        def get_response(request):
+            response = http.HttpResponse('iPhone' in request.META.get('HTTP_USER_AGENT', '') and 'mobile' or 'desktop')
+            patch_vary_headers(response, ('User-Agent',))
+            return response
+        transform_middleware = middleware.UrlPathTransformMiddleware(get_response)
+        translation.activate('en')
+        responses = [transform_middleware(client.RequestFactory().get('/en/home/', HTTP_USER_AGENT=user_agent))
+                     for user_agent in ('iPhone', 'Firefox')]
+        self.assertEqual([response.content for response in responses], ['mobile', 'desktop'])
+        
+    def test_single_redirect(self):
+        #without LocaleMiddleware the language stays activated between requests
+        corpus = ['/', '/home/', '/en/home/', '/de/home/?page=2', '/zh-cn/', '/articles/2011/01/']
+        self.assertEqual(diagnostics.find_redirect_chains(corpus), [])
+        translation.activate('en')
+        self.assertEqual(diagnostics.find_redirect_chains(['/home/'], min_hops=1),
+                         [[('/home/', 302), ('/en/home/', 200)]])
+        #the default language is redirected to the path without language
+        app_settings.URLI18N_ALWAYS_SHOW_LANGUAGE = False
+        translation.activate('en')
+        self.assertEqual(diagnostics.follow_redirects('/en/home/?page=2'),
+                         [('/en/home/?page=2', 302), ('/home/?page=2', 200)])
+        self.assertEqual(diagnostics.find_redirect_chains(corpus), [])
+        self.assertEqual(diagnostics.find_redirect_chains(corpus, HTTP_REFERER='http://testserver/'), [])
+        
+    def test_redirect_chains_referer(self):
+        #redirects are followed with the Referer of the first request, like browsers do
+        settings.MIDDLEWARE_CLASSES = (
+            'django.middleware.common.CommonMiddleware',
+            'django.middleware.locale.LocaleMiddleware',
+            'urli18n.middleware.UrlPathTransformMiddleware',
+        )
+        self.assertEqual(diagnostics.follow_redirects('/de/home', HTTP_ACCEPT_LANGUAGE='en'),
+                         [('/de/home', 301), ('/de/home/', 200)])
+        hops = diagnostics.follow_redirects('/de/home', HTTP_ACCEPT_LANGUAGE='en', HTTP_REFERER='http://testserver/en/')
+        self.assertEqual(len(hops), 2)
+        self.assertEqual(hops[-1][1], 200)
+        output = StringIO.StringIO()
+        stdin = sys.stdin
+        sys.stdin = StringIO.StringIO('/de/home\n')
+        try:
+            management.call_command('urli18n_redirect_chains', accept_language='en', min_hops=1, stdout=output)
+        finally:
+            sys.stdin = stdin
+        self.assertEqual(output.getvalue(), '/de/home (301) -> /de/home/ (200)\n1 of 1 url\'s redirected 1 times or more.\n')
+        
+    def test_wsgi_redirects(self):
+        settings.MIDDLEWARE_CLASSES = (
+            'django.middleware.locale.LocaleMiddleware',
+            'urli18n.middleware.UrlPathTransformMiddleware',
+            'django.middleware.common.CommonMiddleware',
+        )
+        corpus = [('/', {}), ('/home/?page=2', {'HTTP_ACCEPT_LANGUAGE': 'de'}), ('/home', {}),
+                  ('/de/home/', {'HTTP_ACCEPT_LANGUAGE': 'en'}), ('/de/home', {}),
+                  ('/de/home/', {'HTTP_ACCEPT_LANGUAGE': 'en', 'HTTP_REFERER': 'http://testserver/en/'}),
+                  ('/zh-cn/', {'HTTP_COOKIE': '%s=zh-cn' % settings.LANGUAGE_COOKIE_NAME}),
+                  ('/en/home/', {})]
+        answered = []
+        for always_show_language in (True, False):
+            app_settings.URLI18N_ALWAYS_SHOW_LANGUAGE = always_show_language
+            for path, extra in corpus:
+                response = self.client.get(path, **extra)
+                redirect = wsgi.get_redirect(client.RequestFactory().get(path, **extra).environ)
+                #redirects answered by the WSGI layer are the same as the ones of the middleware
+                if redirect is not None:
+                    self.assertEqual(redirect[0], response['Location'])
+                    self.assertEqual(app_settings.URLI18N_REDIRECT_STATUS[redirect[1]], response.status_code)
+                    answered.append((path, always_show_language))
+        self.assertTrue(('/', True) in answered and ('/home/?page=2', False) in answered)
+        #the redirect is answered without calling the application
+        app_settings.URLI18N_ALWAYS_SHOW_LANGUAGE = True
+        def application(environ, start_response):
+            self.fail('the application should not be called')
+        statuses = []
+        output = wsgi.LanguageRedirectMiddleware(application)(
+            client.RequestFactory().get('/home/').environ, lambda status, headers: statuses.append((status, dict(headers))))
+        self.assertEqual(output, [''])
+        self.assertEqual(statuses[0][0], '302 FOUND')
+        self.assertEqual(statuses[0][1]['Location'], 'http://testserver/en/home/')
+        #requests with session cookie are passed through
+        settings.MIDDLEWARE_CLASSES = ('django.contrib.sessions.middleware.SessionMiddleware',) + settings.MIDDLEWARE_CLASSES
+        self.assertEqual(wsgi.get_redirect(client.RequestFactory().get(
+            '/', HTTP_COOKIE='%s=abc' % settings.SESSION_COOKIE_NAME).environ), None)
+        
+    def test_scope_language_locale_middleware(self):
+        app_settings.URLI18N_SCOPE_LANGUAGE = True
+        settings.MIDDLEWARE_CLASSES = (
+            'django.middleware.locale.LocaleMiddleware',
+            'urli18n.middleware.UrlPathTransformMiddleware',
+        )
+        response = self.client.get('/de/home/', HTTP_ACCEPT_LANGUAGE='en')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Language'], 'de')
+        
+    def test_scope_language(self):
+        app_settings.URLI18N_SCOPE_LANGUAGE = True
+        translation.activate('en')
+        response = self.client.get('/de/home/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(translation.get_language(), 'en')
+        #concurrent requests keep their own language
+        transform_middleware = middleware.UrlPathTransformMiddleware()
+        results = []
+        def serve(language):
+            translation.activate('en')
+            for i in range(20):
+                request = client.RequestFactory().get('/%s/articles/2011/01/' % language)
+                response = transform_middleware.process_request(request)
+                results.append((language, request.LANGUAGE_CODE))
+                transform_middleware.process_response(request, response)
+                results.append((language, translation.get_language() == 'en' and language or None))
+        threads = [threading.Thread(target=serve, args=(language,)) for language in ('de', 'zh-cn', 'de', 'zh-cn')]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(results), 160)
+        self.assertEqual([result for result in results if result[0] != result[1]], [])
+        
+    def test_append_slash(self):
+        #path's which are not included are not resolved
+        settings.MIDDLEWARE_CLASSES = ('django.middleware.common.CommonMiddleware',
+                                       'urli18n.middleware.UrlPathTransformMiddleware')
+        resolved = []
+        resolve = utils.resolve
+        def recording_resolve(path):
+            resolved.append(path)
+            return resolve(path)
+        utils.resolve = recording_resolve
+        try:
+            self.assertEqual(utils.append_slash('/favicon.ico'), '/favicon.ico')
+            self.assertEqual(resolved, [])
+            self.assertEqual(utils.append_slash('/home'), '/home/')
+            self.assertEqual(resolved, ['/home', '/home/'])
+        finally:
+            utils.resolve = resolve
+        for middleware_classes in (('django.middleware.common.CommonMiddleware',
+                                    'urli18n.middleware.UrlPathTransformMiddleware'),
+                                   ('urli18n.middleware.UrlPathTransformMiddleware',
+                                    'django.middleware.common.CommonMiddleware')):
+            settings.MIDDLEWARE_CLASSES = middleware_classes
+            translation.activate('en')
+            hops = diagnostics.follow_redirects('/home?page=2')
+            self.assertEqual([hop[0] for hop in hops], ['/home?page=2', '/en/home/?page=2'])
+            self.assertEqual(hops[-1][1], 200)
+            hops = diagnostics.follow_redirects('/de/home')
+            self.assertEqual([hop[0] for hop in hops], ['/de/home', '/de/home/'])
+            self.assertEqual(hops[-1][1], 200)
+        
+    def test_serve_in_place(self):
+        app_settings.URLI18N_SERVE_IN_PLACE = True
+        translation.activate('de')
+        response = self.client.get('/home/?page=2')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Location'], '/de/home/?page=2')
+        self.assertEqual(response['Link'], '<http://testserver/de/home/?page=2>; rel="canonical"')
+        self.assertTrue('Accept-Language' in response['Vary'] and 'Cookie' in response['Vary'])
+        #requests with language are not affected
+        response = self.client.get('/de/home/')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('Content-Location'))
+        
+    def test_rewrite_redirects(self):
+        translation.activate('de')
+        request = client.RequestFactory().get('/de/home/')
+        transform_middleware = middleware.UrlPathTransformMiddleware()
+        response = transform_middleware.process_response(request, http.HttpResponseRedirect('/home/?page=2'))
+        self.assertEqual(response['Location'], '/home/?page=2')
+        app_settings.URLI18N_REWRITE_REDIRECTS = True
+        for location, expected in (('/home/?page=2#top', '/de/home/?page=2#top'),
+                                   ('http://testserver/home/', 'http://testserver/de/home/'),
+                                   ('http://example.com/home/', 'http://example.com/home/'),
+                                   ('/en/home/', '/en/home/'),
+                                   ('/unknown/', '/unknown/'),
+                                   ('home/', 'home/')):
+            response = transform_middleware.process_response(request, http.HttpResponseRedirect(location))
+            self.assertEqual(response['Location'], expected)
+        response = transform_middleware.process_response(request, http.HttpResponsePermanentRedirect('/'))
+        self.assertEqual(response['Location'], '/de/')
+        
+    def test_rewrite_response_links(self):
+        translation.activate('de')
+        request = client.RequestFactory().get('/de/')
+        transform_middleware = middleware.UrlPathTransformMiddleware()
+        content = '<a href="/home/">Home</a> <form action="/">'
+        response = transform_middleware.process_response(request, http.HttpResponse(content))
+        self.assertEqual(response.content, content)
+        app_settings.URLI18N_REWRITE_RESPONSE_LINKS = True
+        response = http.HttpResponse(content)
+        response['Content-Length'] = str(len(content))
+        response = transform_middleware.process_response(request, response)
+        self.assertEqual(response.content, '<a href="/de/home/">Home</a> <form action="/de/">')
+        self.assertEqual(response['Content-Length'], str(len(response.content)))
+        response = http.HttpResponse(content, content_type='text/plain')
+        self.assertEqual(transform_middleware.process_response(request, response).content, content)
+        #a tag split across chunks of an iterator is rewritten as well
+        response = http.HttpResponse(iter(['<p><a hr', 'ef="/home/">Home</a', '></p>']))
+        response = transform_middleware.process_response(request, response)
+        self.assertEqual(''.join(response), '<p><a href="/de/home/">Home</a></p>')
+        
+    def test_rewrite_response_budget(self):
+        translation.activate('de')
+        rewriter = utils.LinkRewriter('de', budget=30)
+        chunks = ['<a href="/home/">Home</a>', '<a href="/">Start</a>', '<a href="/">Start</a>']
+        self.assertEqual(''.join(rewriter.rewrite(chunks)),
+                         '<a href="/de/home/">Home</a><a href="/de/">Start</a><a href="/">Start</a>')
+        self.assertTrue(rewriter.exhausted())
+        
+    def test_sitemap(self):
+        request = client.RequestFactory().get('/sitemap-pages.xml')
+        response = sitemaps.sitemap(request, test_urls.sitemaps, 'pages')
+        self.assertEqual(response['Content-Type'], 'application/xml')
+        content = response.content
+        self.assertEqual(content.count('<url>'), 9)
+        self.assertTrue('<url><loc>http://testserver/zh-cn/home/</loc><changefreq>daily</changefreq>'
+                        '<xhtml:link rel="alternate" hreflang="de" href="http://testserver/de/home/"/>'
+                        '<xhtml:link rel="alternate" hreflang="en" href="http://testserver/en/home/"/>'
+                        '<xhtml:link rel="alternate" hreflang="zh-cn" href="http://testserver/zh-cn/home/"/>'
+                        '</url>' in content)
+        #middleware classes reading the content don't exhaust it
+        settings.MIDDLEWARE_CLASSES = ('django.middleware.http.ConditionalGetMiddleware',
+                                       'urli18n.middleware.UrlPathTransformMiddleware')
+        response = self.client.get('/sitemap-pages.xml')
+        body = ''.join(response)
+        self.assertEqual(body.count('<url>'), 9)
+        self.assertEqual(response['Content-Length'], str(len(body)))
+        #a location with language is transformed for all languages as well
+        site = test_urls.PathSitemap()
+        site.items = lambda: ['/en/home/']
+        urls = site.get_urls(site=sitemaps.get_current_site(request))
+        self.assertEqual([url['location'] for url in urls], ['http://testserver/de/home/', 'http://testserver/en/home/',
+                                                       'http://testserver/zh-cn/home/'])
+        
+    def test_sitemap_sharding(self):
+        test_urls.PathSitemap.limit = 6
+        try:
+            request = client.RequestFactory().get('/sitemap.xml')
+            content = sitemaps.index(request, test_urls.sitemaps).content
+            self.assertTrue('<loc>http://testserver/sitemap-pages.xml</loc>' in content)
+            self.assertTrue('<loc>http://testserver/sitemap-pages.xml?p=2</loc>' in content)
+            self.assertEqual(content.count('<sitemap>'), 2)
+            request = client.RequestFactory().get('/sitemap-pages.xml', {'p': 2})
+            content = sitemaps.sitemap(request, test_urls.sitemaps, 'pages').content
+            self.assertEqual(content.count('<url>'), 3)
+            self.assertTrue('<loc>http://testserver/en/articles/2011/11/</loc>' in content)
+            request = client.RequestFactory().get('/sitemap-pages.xml', {'p': 3})
+            self.assertRaises(http.Http404, sitemaps.sitemap, request, test_urls.sitemaps, 'pages')
+        finally:
+            del test_urls.PathSitemap.limit
+        
+    def test_alternates_tag(self):
+        translation.activate('de')
+        t = template.Template("{% load urli18n_tags %}{% urli18n_alternates %}")
+        request = client.RequestFactory().get('/zh-cn/home/?page=2')
+        output = t.render(template.Context({'request': request}))
+        self.assertEqual(output, '<link rel="alternate" hreflang="de" href="http://testserver/de/home/?page=2" />\n'
+                                 '<link rel="alternate" hreflang="en" href="http://testserver/en/home/?page=2" />\n'
+                                 '<link rel="alternate" hreflang="zh-cn" href="http://testserver/zh-cn/home/?page=2" />')
+        self.assertEqual(translation.get_language(), 'de')
+        request = client.RequestFactory().get('/en/home/?page=2')
+        self.assertEqual(t.render(template.Context({'request': request})), output)
+        self.assertEqual(utils.cache_info('alternates')['hits'], 1)
+        request = client.RequestFactory().get('/unknown/')
+        self.assertEqual(t.render(template.Context({'request': request})), '')
+        
     def test_template_filter(self):
         translation.activate('en')
         path = urli18n_tags.transform_url_filter('/')
@@ -383,6 +958,12 @@ class UrlQuerystringTransformMiddlewareTestCase(TestCase):
         app_settings.URLI18N_INCLUDE_PATHS = self.included_paths
         app_settings.URLI18N_ALWAYS_SHOW_LANGUAGE = True
         app_settings.URLI18N_QUERYSTRING_NAME = 'lang'
+        self.curr_app_URLI18N_CANONICAL_QUERYSTRING = app_settings.URLI18N_CANONICAL_QUERYSTRING
+        self.curr_app_URLI18N_SERVE_IN_PLACE = app_settings.URLI18N_SERVE_IN_PLACE
+        self.curr_app_URLI18N_REDIRECT_STATUS = app_settings.URLI18N_REDIRECT_STATUS
+        self.curr_app_URLI18N_REDIRECT_CACHE_CONTROL = app_settings.URLI18N_REDIRECT_CACHE_CONTROL
+        self.curr_app_URLI18N_PAGE_CACHE = app_settings.URLI18N_PAGE_CACHE
+        self.curr_app_URLI18N_SCOPE_LANGUAGE = app_settings.URLI18N_SCOPE_LANGUAGE
     
     def tearDown(self):
         settings.MIDDLEWARE_CLASSES = self.curr_MIDDLEWARE_CLASSES
@@ -390,6 +971,13 @@ class UrlQuerystringTransformMiddlewareTestCase(TestCase):
         settings.LANGUAGES = self.curr_LANGUAGES
         app_settings.URLI18N_INCLUDE_PATHS = self.curr_app_URLI18N_INCLUDE_PATHS
         app_settings.URLI18N_ALWAYS_SHOW_LANGUAGE = self.curr_app_URLI18N_ALWAYS_SHOW_LANGUAGE
+        app_settings.URLI18N_REDIRECT_STATUS = self.curr_app_URLI18N_REDIRECT_STATUS
+        app_settings.URLI18N_REDIRECT_CACHE_CONTROL = self.curr_app_URLI18N_REDIRECT_CACHE_CONTROL
+        app_settings.URLI18N_CANONICAL_QUERYSTRING = self.curr_app_URLI18N_CANONICAL_QUERYSTRING
+        app_settings.URLI18N_PAGE_CACHE = self.curr_app_URLI18N_PAGE_CACHE
+        app_settings.URLI18N_SCOPE_LANGUAGE = self.curr_app_URLI18N_SCOPE_LANGUAGE
+        cache.clear()
+        app_settings.URLI18N_SERVE_IN_PLACE = self.curr_app_URLI18N_SERVE_IN_PLACE
     
     def test_view1_en(self):
         #first with standard settings
@@ -696,6 +1284,179 @@ class UrlQuerystringTransformMiddlewareTestCase(TestCase):
         path = urli18n_tags.transform_url('/?lang=zh-cn')
         self.assertEqual(path, '/?lang=zh-cn')
         
+    def test_transform_paths(self):
+        paths = ['/', '/home/?page=2', '/home/?lang=de', '/articles/2011/01/', '/media/image.png', '/unknown/']
+        self.assertEqual(list(utils.transform_paths(paths, language='de')),
+                         [utils.transform_path(path, 'de') for path in paths])
+        
+    def test_redirect_status(self):
+        app_settings.URLI18N_REDIRECT_STATUS = dict(app_settings.URLI18N_REDIRECT_STATUS, missing=308, default=301)
+        app_settings.URLI18N_REDIRECT_CACHE_CONTROL = 'max-age=60'
+        translation.activate('en')
+        response = self.client.get('/home/')
+        self.assertEqual(response.status_code, 308)
+        self.assertEqual(response['Location'], 'http://testserver/home/?lang=en')
+        self.assertEqual(response['Cache-Control'], 'max-age=60')
+        self.assertEqual(response['Vary'], 'Accept-Language, Cookie')
+        app_settings.URLI18N_ALWAYS_SHOW_LANGUAGE = False
+        response = self.client.get('/home/?lang=en')
+        self.assertEqual(response.status_code, 301)
+        self.assertEqual(response['Location'], 'http://testserver/home/')
+        self.assertEqual(response['Vary'], 'Accept-Language, Cookie, Referer')
+        #switching back to the active language depends on the referer
+        app_settings.URLI18N_ALWAYS_SHOW_LANGUAGE = True
+        translation.activate('en')
+        response = self.client.get('/home/?lang=de', HTTP_REFERER='http://testserver/home/?lang=en')
+        self.assertEqual(response['Location'], 'http://testserver/home/?lang=en')
+        self.assertEqual(response['Vary'], 'Accept-Language, Cookie, Referer')
+        #so do the slash and canonical redirects of url's with language
+        settings.MIDDLEWARE_CLASSES = (
+            'django.middleware.common.CommonMiddleware',
+            'django.middleware.locale.LocaleMiddleware',
+            'urli18n.middleware.UrlQuerystringTransformMiddleware',
+        )
+        response = self.client.get('/home?lang=de', HTTP_ACCEPT_LANGUAGE='de')
+        self.assertEqual(response['Location'], 'http://testserver/home/?lang=de')
+        self.assertEqual(response['Vary'], 'Accept-Language, Cookie, Referer')
+        app_settings.URLI18N_CANONICAL_QUERYSTRING = True
+        response = self.client.get('/home/?lang=de&b=2&a=1', HTTP_ACCEPT_LANGUAGE='de')
+        self.assertEqual(response['Location'], 'http://testserver/home/?a=1&b=2&lang=de')
+        self.assertEqual(response['Vary'], 'Accept-Language, Cookie, Referer')
+        
+    def test_canonical_querystring(self):
+        self.assertEqual(utils.canonical_querystring(['utm_source=x', 'lang=de', 'b=2', 'a=1', 'b=1', ''], 1),
+                         (['a=1', 'b=2', 'b=1', 'lang=de'], 3))
+        translation.activate('de')
+        response = self.client.get('/home/?utm_source=x&lang=de&b=2&a=1')
+        self.assertEqual(response.status_code, 200)
+        app_settings.URLI18N_CANONICAL_QUERYSTRING = True
+        response = self.client.get('/home/?utm_source=x&b=2&a=1')
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response['Location'], 'http://testserver/home/?a=1&b=2&lang=de')
+        translation.activate('de')
+        response = self.client.get('/home/?lang=de&utm_source=x&b=2&a=1')
+        self.assertEqual(response.status_code, 301)
+        self.assertEqual(response['Location'], 'http://testserver/home/?a=1&b=2&lang=de')
+        translation.activate('de')
+        response = self.client.get('/home/?a=1&b=2&lang=de')
+        self.assertEqual(response.status_code, 200)
+        
+    def test_page_cache(self):
+        app_settings.URLI18N_PAGE_CACHE = 'default'
+        translation.activate('de')
+        response = self.client.get('/articles/2011/01/?lang=de&page=2')
+        self.assertEqual(response.content, '2011-01')
+        key = utils.page_cache_key('testserver', False, 'de', '/articles/2011/01/', ['page=2'])
+        cache.set(key, http.HttpResponse('cached'))
+        response = self.client.get('/articles/2011/01/?page=2&lang=de')
+        self.assertEqual(response.content, 'cached')
+        
+    def test_wsgi_redirects(self):
+        settings.MIDDLEWARE_CLASSES = (
+            'django.middleware.locale.LocaleMiddleware',
+            'urli18n.middleware.UrlQuerystringTransformMiddleware',
+        )
+        corpus = [('/', {}), ('/home/?page=2', {'HTTP_ACCEPT_LANGUAGE': 'de'}), ('/home/?lang=zh-cn', {}),
+                  ('/home/?lang=de', {'HTTP_ACCEPT_LANGUAGE': 'en', 'HTTP_REFERER': 'http://testserver/'}),
+                  ('/home/?lang=en', {}), ('/home/?utm_source=x&b=1&a=2&lang=en', {})]
+        answered = []
+        for always_show_language, canonical_querystring in ((True, False), (False, False), (True, True)):
+            app_settings.URLI18N_ALWAYS_SHOW_LANGUAGE = always_show_language
+            app_settings.URLI18N_CANONICAL_QUERYSTRING = canonical_querystring
+            for path, extra in corpus:
+                response = self.client.get(path, **extra)
+                redirect = wsgi.get_redirect(client.RequestFactory().get(path, **extra).environ)
+                #redirects answered by the WSGI layer are the same as the ones of the middleware
+                if redirect is not None:
+                    self.assertEqual(redirect[0], response['Location'])
+                    self.assertEqual(app_settings.URLI18N_REDIRECT_STATUS[redirect[1]], response.status_code)
+                    answered.append((path, always_show_language))
+        self.assertTrue(('/', True) in answered and ('/home/?lang=en', False) in answered)
+        #the WSGI layer sends the same headers
+        statuses = []
+        app_settings.URLI18N_ALWAYS_SHOW_LANGUAGE = True
+        wsgi.LanguageRedirectMiddleware(None)(
+            client.RequestFactory().get('/home/?lang=de', HTTP_ACCEPT_LANGUAGE='en',
+                                        HTTP_REFERER='http://testserver/').environ,
+            lambda status, headers: statuses.append((status, dict(headers))))
+        self.assertEqual(statuses[0][1]['Location'], 'http://testserver/home/?lang=en')
+        self.assertEqual(statuses[0][1]['Vary'], 'Accept-Language, Cookie, Referer')
+        
+    def test_scope_language(self):
+        app_settings.URLI18N_SCOPE_LANGUAGE = True
+        translation.activate('en')
+        response = self.client.get('/home/?lang=de')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(translation.get_language(), 'en')
+        request = client.RequestFactory().get('/home/?lang=zh-cn')
+        transform_middleware = middleware.UrlQuerystringTransformMiddleware()
+        self.assertEqual(transform_middleware.process_request(request), None)
+        self.assertEqual(translation.get_language(), 'zh-cn')
+        transform_middleware.process_response(request, http.HttpResponse())
+        self.assertEqual(translation.get_language(), 'en')
+        self.assertEqual(request.LANGUAGE_CODE, 'zh-cn')
+        
+    def test_append_slash(self):
+        for middleware_classes in (('django.middleware.common.CommonMiddleware',
+                                    'urli18n.middleware.UrlQuerystringTransformMiddleware'),
+                                   ('urli18n.middleware.UrlQuerystringTransformMiddleware',
+                                    'django.middleware.common.CommonMiddleware')):
+            settings.MIDDLEWARE_CLASSES = middleware_classes
+            translation.activate('en')
+            hops = diagnostics.follow_redirects('/home?page=2')
+            self.assertEqual([hop[0] for hop in hops], ['/home?page=2', '/home/?page=2&lang=en'])
+            self.assertEqual(hops[-1][1], 200)
+        
+    def test_serve_in_place(self):
+        app_settings.URLI18N_SERVE_IN_PLACE = True
+        translation.activate('de')
+        response = self.client.get('/home/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Location'], '/home/?lang=de')
+        self.assertEqual(response['Link'], '<http://testserver/home/?lang=de>; rel="canonical"')
+        #switching the language is still redirected
+        response = self.client.get('/home/?lang=en', HTTP_REFERER='http://testserver/')
+        self.assertRedirects(response, '/home/?lang=de')
+        
+    def test_rewrite_redirects(self):
+        app_settings.URLI18N_REWRITE_REDIRECTS = True
+        translation.activate('de')
+        request = client.RequestFactory().get('/home/', {'lang': 'de'})
+        transform_middleware = middleware.UrlQuerystringTransformMiddleware()
+        for location, expected in (('/home/?page=2', '/home/?page=2&lang=de'),
+                                   ('/home/?lang=en', '/home/?lang=en'),
+                                   ('/media/image.png', '/media/image.png')):
+            response = transform_middleware.process_response(request, http.HttpResponseRedirect(location))
+            self.assertEqual(response['Location'], expected)
+        app_settings.URLI18N_REWRITE_REDIRECTS = False
+        
+    def test_rewrite_links(self):
+        content = '<a href="/home/?page=2&amp;sort=date">Home</a> <a href="/home/?lang=de">Home</a>'
+        self.assertEqual(utils.rewrite_links(content, 'de'),
+                         '<a href="/home/?page=2&amp;sort=date&amp;lang=de">Home</a> <a href="/home/?lang=de">Home</a>')
+        self.assertEqual(utils.rewrite_links(content, 'en'),
+                         '<a href="/home/?page=2&amp;sort=date&amp;lang=en">Home</a> <a href="/home/?lang=de">Home</a>')
+        self.assertEqual(utils.rewrite_links('<a href="/login/?u=x">x</a>', 'en'), '<a href="/login/?u=x">x</a>')
+        
+    def test_sitemap(self):
+        request = client.RequestFactory().get('/sitemap-pages.xml')
+        content = sitemaps.sitemap(request, test_urls.sitemaps, 'pages').content
+        self.assertEqual(content.count('<url>'), 9)
+        self.assertTrue('<url><loc>http://testserver/home/?lang=zh-cn</loc><changefreq>daily</changefreq>'
+                        '<xhtml:link rel="alternate" hreflang="de" href="http://testserver/home/?lang=de"/>'
+                        '<xhtml:link rel="alternate" hreflang="en" href="http://testserver/home/?lang=en"/>'
+                        '<xhtml:link rel="alternate" hreflang="zh-cn" href="http://testserver/home/?lang=zh-cn"/>'
+                        '</url>' in content)
+        
+    def test_alternates_tag(self):
+        app_settings.URLI18N_ALWAYS_SHOW_LANGUAGE = False
+        t = template.Template("{% load urli18n_tags %}{% urli18n_alternates %}")
+        request = client.RequestFactory().get('/home/?lang=de&page=2')
+        output = t.render(template.Context({'request': request}))
+        self.assertEqual(output, '<link rel="alternate" hreflang="de" href="http://testserver/home/?page=2&amp;lang=de" />\n'
+                                 '<link rel="alternate" hreflang="en" href="http://testserver/home/?page=2" />\n'
+                                 '<link rel="alternate" hreflang="zh-cn" href="http://testserver/home/?page=2&amp;lang=zh-cn" />')
+        
     def test_template_filter(self):
         translation.activate('en')
         path = urli18n_tags.transform_url_filter('/')
@@ -742,4 +1503,329 @@ class UrlQuerystringTransformMiddlewareTestCase(TestCase):
         self.assertEqual(path, '/home/?lang=zh-cn')
         path = urli18n_tags.transform_url_filter('/?lang=zh-cn')
         self.assertEqual(path, '/?lang=zh-cn')
+
+
+class UrlHostTransformMiddlewareTestCase(TestCase):
+    urls = 'urli18n.tests.urls'
+    
+    def setUp(self):
+        self.curr_MIDDLEWARE_CLASSES = settings.MIDDLEWARE_CLASSES
+        self.curr_LANGUAGE_CODE = settings.LANGUAGE_CODE
+        self.curr_LANGUAGES = settings.LANGUAGES
+        self.curr_app_URLI18N_INCLUDE_PATHS = app_settings.URLI18N_INCLUDE_PATHS
+        self.curr_app_URLI18N_HOSTS = app_settings.URLI18N_HOSTS
+        settings.MIDDLEWARE_CLASSES = (
+            'urli18n.middleware.UrlHostTransformMiddleware',
+        )
+        settings.LANGUAGE_CODE = 'en'
+        settings.LANGUAGES = (
+            ('de', 'Deutsch'),
+            ('en', 'English'),
+            ('zh-cn', '中文'),
+        )
+        app_settings.URLI18N_INCLUDE_PATHS = ['/', 'home/', '^articles/(\d{4})/(\d{2})/$']
+        app_settings.URLI18N_HOSTS = {
+            'de': 'de.example.com',
+            'en': 'www.example.com',
+            'zh-cn': 'Example.CN',
+        }
+    
+    def tearDown(self):
+        settings.MIDDLEWARE_CLASSES = self.curr_MIDDLEWARE_CLASSES
+        settings.LANGUAGE_CODE = self.curr_LANGUAGE_CODE
+        settings.LANGUAGES = self.curr_LANGUAGES
+        app_settings.URLI18N_INCLUDE_PATHS = self.curr_app_URLI18N_INCLUDE_PATHS
+        app_settings.URLI18N_HOSTS = self.curr_app_URLI18N_HOSTS
+        utils.clear_caches()
+    
+    def test_host_language(self):
+        self.assertEqual(utils.get_middleware_mode(), 'host')
+        self.assertEqual(utils.get_host_language('de.example.com'), 'de')
+        self.assertEqual(utils.get_host_language('DE.example.com:8000'), 'de')
+        self.assertEqual(utils.get_host_language('example.cn'), 'zh-cn')
+        self.assertEqual(utils.get_host_language('example.org'), None)
+        self.assertEqual(utils.get_language_host('en'), 'www.example.com')
+    
+    def test_request(self):
+        translation.activate('en')
+        response = self.client.get('/home/', HTTP_HOST='de.example.com')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(translation.get_language(), 'de')
+        response = self.client.get('/', HTTP_HOST='example.cn:8000')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(translation.get_language(), 'zh-cn')
+        #unknown hosts keep the active language
+        response = self.client.get('/home/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(translation.get_language(), 'zh-cn')
+    
+    def test_transform_path(self):
+        translation.activate('de')
+        self.assertEqual(utils.transform_path('/home/'), '//de.example.com/home/')
+        self.assertEqual(utils.transform_path('/home/?page=2', 'en'), '//www.example.com/home/?page=2')
+        self.assertEqual(utils.transform_path('//example.org/home/', 'en'), '//example.org/home/')
+        self.assertEqual(list(utils.transform_paths(['/home/', '/articles/2011/11/', 'home/'], 'zh-cn')),
+                         ['//Example.CN/home/', '//Example.CN/articles/2011/11/', 'home/'])
+        self.assertEqual(utils.strip_language('/home/'), '/home/')
+        self.assertEqual(utils.transform_location('http://testserver/home/#top', 'testserver', 'de'),
+                         'http://de.example.com/home/#top')
+        t = template.Template("{% load urli18n_tags %}{% transform_url '/home/' %}")
+        self.assertEqual(t.render(template.Context()), '//de.example.com/home/')
+        app_settings.URLI18N_HOSTS = {'de': 'de.example.com'}
+        self.assertEqual(utils.transform_path('/home/', 'en'), '/home/')
+        self.assertEqual(list(utils.transform_paths(['/home/'], 'en')), ['/home/'])
+    
+    def test_sitemap(self):
+        request = client.RequestFactory().get('/sitemap-pages.xml')
+        content = sitemaps.sitemap(request, test_urls.sitemaps, 'pages').content
+        self.assertEqual(content.count('<url>'), 9)
+        self.assertTrue('<url><loc>http://de.example.com/home/</loc><changefreq>daily</changefreq>'
+                        '<xhtml:link rel="alternate" hreflang="de" href="http://de.example.com/home/"/>'
+                        '<xhtml:link rel="alternate" hreflang="en" href="http://www.example.com/home/"/>'
+                        '<xhtml:link rel="alternate" hreflang="zh-cn" href="http://Example.CN/home/"/>'
+                        '</url>' in content)
+
+
+class LanguagePrefixedUrlconfTestCase(UrlPathTransformMiddlewareTestCase):
+    urls = 'urli18n.tests.i18n_urls'
+    
+    def setUp(self):
+        super(LanguagePrefixedUrlconfTestCase, self).setUp()
+        app_settings.URLI18N_DISPATCH_MODE = 'urlconf'
+        
+    def test_new_style_middleware(self):
+        requests = []
+        def get_response(request):
+            requests.append(request)
+            return http.HttpResponse()
+        middleware_object = middleware.UrlPathTransformMiddleware(get_response)
+        translation.activate('de')
+        response = middleware_object(client.RequestFactory().get('/de/home/'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(requests[0].path_info, '/de/home/')
+        
+    def test_scope_language(self):
+        app_settings.URLI18N_SCOPE_LANGUAGE = True
+        translation.activate('en')
+        response = self.client.get('/de/home/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(translation.get_language(), 'en')
+        #the url conf passes the language to process_view
+        transform_middleware = middleware.UrlPathTransformMiddleware()
+        request = client.RequestFactory().get('/zh-cn/home/')
+        self.assertEqual(transform_middleware.process_view(request, None, (), {urli18n_urls.LANGUAGE_KWARG: 'zh-cn'}), None)
+        self.assertEqual(translation.get_language(), 'zh-cn')
+        transform_middleware.process_response(request, http.HttpResponse())
+        self.assertEqual(translation.get_language(), 'en')
+        self.assertEqual(request.LANGUAGE_CODE, 'zh-cn')
+        
+    def test_resolve_cache(self):
+        app_settings.URLI18N_RESOLVE_CACHE_SIZE = 2
+        translation.activate('en')
+        response = self.client.get('/en/home/')
+        self.assertEqual(response.status_code, 200)
+        #the url conf resolves the path, the middleware doesn't
+        self.assertEqual(utils.cache_info('resolve'), None)
+        
+    def test_page_cache_language(self):
+        app_settings.URLI18N_PAGE_CACHE = 'default'
+        settings.MIDDLEWARE_CLASSES = (
+            'django.middleware.locale.LocaleMiddleware',
+            'urli18n.middleware.UrlPathTransformMiddleware',
+        )
+        #the cached response is served in the language of the url path
+        for i in range(2):
+            response = self.client.get('/de/home/', HTTP_ACCEPT_LANGUAGE='en')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Language'], 'de')
+        self.assertNotEqual(cache.get(utils.page_cache_key('testserver', False, 'de', '/home/', [''])), None)
+        #the path is checked once per request
+        checked = []
+        is_included_path = utils.is_included_path
+        def recording_is_included_path(path, strict_mode=True):
+            checked.append(path)
+            return is_included_path(path, strict_mode)
+        utils.is_included_path = recording_is_included_path
+        try:
+            self.client.get('/en/articles/2011/01/', HTTP_ACCEPT_LANGUAGE='en')
+            self.assertEqual(checked.count('/articles/2011/01/'), 1)
+        finally:
+            utils.is_included_path = is_included_path
+        
+    def test_redirect_vary(self):
+        settings.MIDDLEWARE_CLASSES = (
+            'django.middleware.locale.LocaleMiddleware',
+            'urli18n.middleware.UrlPathTransformMiddleware',
+        )
+        app_settings.URLI18N_ALWAYS_SHOW_LANGUAGE = False
+        response = self.client.get('/en/home/', HTTP_ACCEPT_LANGUAGE='en')
+        self.assertEqual(response['Location'], 'http://testserver/home/')
+        self.assertEqual(response['Vary'], 'Accept-Language, Cookie, Referer')
+        
+    def test_urlpatterns(self):
+        urlpatterns = urli18n_urls.language_prefixed_urlpatterns('urli18n.tests.urls')
+        self.assertEqual(len(urlpatterns), 8)
+        self.assertEqual(len(urlpatterns[0].url_patterns), 7)
+        
+    def test_include_expression(self):
+        #the include expression differs from the url pattern, the path decides
+        app_settings.URLI18N_INCLUDE_PATHS = ['/home', r'^/articles/\d+/\d+/$']
+        translation.activate('en')
+        response = self.client.get('/articles/2011/01/')
+        self.assertRedirects(response, '/en/articles/2011/01/')
+        response = self.client.get('/en/articles/2011/01/')
+        self.assertEqual(response.content, '2011-01')
+        #url path's which are not included are not served with language prefix
+        transform_middleware = middleware.UrlPathTransformMiddleware()
+        request = client.RequestFactory().get('/en/articles/2011/01/01/')
+        self.assertRaises(http.Http404, transform_middleware.process_view, request, None, (),
+                          {urli18n_urls.LANGUAGE_KWARG: 'en', 'year': '2011', 'month': '01', 'day': '01'})
+        
+    def test_excluded_path(self):
+        translation.activate('en')
+        response = self.client.get('/en/articles/2011/01/')
+        self.assertEqual(response.status_code, 200)
+        app_settings.URLI18N_INCLUDE_PATHS = ['/home']
+        response = self.client.get('/articles/2011/01/')
+        self.assertEqual(response.status_code, 200)
+        
+    def test_default_language(self):
+        app_settings.URLI18N_ALWAYS_SHOW_LANGUAGE = False
+        translation.activate('de')
+        response = self.client.get('/en/home/')
+        self.assertRedirects(response, '/home/')
+        
+    def test_referer(self):
+        translation.activate('en')
+        response = self.client.get('/de/home/', HTTP_REFERER='http://testserver/en/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(translation.get_language(), 'de')
+
+
+@unittest.skipIf(jinja2 is None, 'Jinja2 is not installed')
+class TransformUrlExtensionTestCase(TestCase):
+    
+    def setUp(self):
+        self.curr_MIDDLEWARE_CLASSES = settings.MIDDLEWARE_CLASSES
+        self.curr_LANGUAGES = settings.LANGUAGES
+        self.curr_app_URLI18N_INCLUDE_PATHS = app_settings.URLI18N_INCLUDE_PATHS
+        settings.MIDDLEWARE_CLASSES = (
+            'urli18n.middleware.UrlPathTransformMiddleware',
+        )
+        settings.LANGUAGES = (
+            ('de', 'Deutsch'),
+            ('en', 'English'),
+        )
+        app_settings.URLI18N_INCLUDE_PATHS = ['/', '/home']
+        self.environment = jinja2.Environment(extensions=['urli18n.jinja2ext.TransformUrlExtension'])
+        
+    def tearDown(self):
+        settings.MIDDLEWARE_CLASSES = self.curr_MIDDLEWARE_CLASSES
+        settings.LANGUAGES = self.curr_LANGUAGES
+        app_settings.URLI18N_INCLUDE_PATHS = self.curr_app_URLI18N_INCLUDE_PATHS
+        utils.clear_caches()
+        
+    def test_filter_and_global(self):
+        t = self.environment.from_string("{{ path|transform_url }} {{ transform_url(path) }} {{ ('/' ~ 'home/')|transform_url }}")
+        translation.activate('de')
+        self.assertEqual(t.render(path='/home/'), '/de/home/ /de/home/ /de/home/')
+        translation.activate('en')
+        self.assertEqual(t.render(path='/'), '/en/ /en/ /en/home/')
+        self.assertEqual(self.environment.urli18n_precomputed_paths, {})
+        
+    def test_literals(self):
+        t = self.environment.from_string("{{ '/home/'|transform_url }} {{ transform_url('/') }} {{ '/home/'|transform_url|upper }}")
+        self.assertEqual(len(self.environment.urli18n_precomputed_paths), 2)
+        translation.activate('de')
+        self.assertEqual(t.render(), '/de/home/ /de/ /DE/HOME/')
+        translation.activate('en')
+        self.assertEqual(t.render(), '/en/home/ /en/ /EN/HOME/')
+        
+    def test_bytecode_cache(self):
+        directory = tempfile.mkdtemp()
+        try:
+            loader = jinja2.DictLoader({
+                'other.html': "{{ transform_url('/') }}",
+                'page.html': "{{ '/home/'|transform_url }} {{ transform_url('/') }}",
+            })
+            environment = jinja2.Environment(loader=loader, bytecode_cache=jinja2.FileSystemBytecodeCache(directory),
+                                             extensions=['urli18n.jinja2ext.TransformUrlExtension'])
+            environment.get_template('page.html')
+            #a fresh environment (e.g. another process) loads the compiled
+            #code from the warm cache, after other templates were compiled
+            environment = jinja2.Environment(loader=loader, bytecode_cache=jinja2.FileSystemBytecodeCache(directory),
+                                             extensions=['urli18n.jinja2ext.TransformUrlExtension'])
+            environment.from_string("{{ transform_url('/de/') }}")
+            environment.get_template('other.html')
+            t = environment.get_template('page.html')
+            translation.activate('de')
+            self.assertEqual(t.render(), '/de/home/ /de/')
+            self.assertEqual(sorted(environment.urli18n_precomputed_paths.keys()), ['/', '/de/', '/home/'])
+        finally:
+            shutil.rmtree(directory)
+
+
+class IncludePathMatcherTestCase(TestCase):
+    
+    def setUp(self):
+        self.curr_app_URLI18N_INCLUDE_PATHS = app_settings.URLI18N_INCLUDE_PATHS
+        self.included_paths = ['/', '/home', '^/dot\.html$', '^articles/(\d{4})/(\d{2})/$',
+                               '^/articles/(?P<year>\d{4})/(?P<month>\d{2})/(?P<day>\d+)/$',
+                               '^/archive/(?P<year>\d{4})/$', '^/mirror/(?P<slug>\w+)/(?P=slug)/$']
+        self.paths = ['/', '/home/', '/home', '/homes/', '/home/blog/', '/dot.html/', '/dotxhtml/',
+                      '/articles/2011/01/', '/articles/2011/01/28/', '/articles/11/01/',
+                      '/archive/2011/', '/mirror/a/a/', '/mirror/a/b/', '/unknown/']
+        app_settings.URLI18N_INCLUDE_PATHS = self.included_paths
+        self.curr_app_URLI18N_INCLUDE_CACHE_SIZE = app_settings.URLI18N_INCLUDE_CACHE_SIZE
+        self.curr_app_URLI18N_INCLUDE_CACHE_NORMALIZE_DIGITS = app_settings.URLI18N_INCLUDE_CACHE_NORMALIZE_DIGITS
+    
+    def tearDown(self):
+        app_settings.URLI18N_INCLUDE_PATHS = self.curr_app_URLI18N_INCLUDE_PATHS
+        app_settings.URLI18N_INCLUDE_CACHE_SIZE = self.curr_app_URLI18N_INCLUDE_CACHE_SIZE
+        app_settings.URLI18N_INCLUDE_CACHE_NORMALIZE_DIGITS = self.curr_app_URLI18N_INCLUDE_CACHE_NORMALIZE_DIGITS
+        utils.clear_caches()
+    
+    def test_tiers(self):
+        matcher = utils.get_include_matcher()
+        self.assertEqual(matcher.literals, frozenset(['/', '/home/', '/dot.html/']))
+        self.assertEqual(matcher.prefixes, {})
+        self.assertEqual(len(matcher.fallback_regexes), 1)
+        matcher = utils.get_include_matcher(strict_mode=False)
+        self.assertEqual(matcher.literals, frozenset(['/dot.html']))
+        self.assertTrue('/' in matcher.prefixes)
+        
+    def test_same_results_as_regular_expressions(self):
+        for strict_mode in (True, False):
+            expressions = [re.compile(utils._edit_path_exp(p, strict_mode), re.UNICODE) for p in self.included_paths]
+            for path in self.paths:
+                expected = bool([e for e in expressions if e.match(path)])
+                self.assertEqual(utils.is_included_path(path, strict_mode), expected)
+                
+    def test_rebuilt_on_setting_change(self):
+        matcher = utils.get_include_matcher()
+        self.assertTrue(utils.get_include_matcher() is matcher)
+        app_settings.URLI18N_INCLUDE_PATHS = ['/blog']
+        self.assertFalse(utils.get_include_matcher() is matcher)
+        self.assertTrue(utils.is_included_path('/blog/'))
+        self.assertFalse(utils.is_included_path('/home/'))
+        
+    def test_decision_cache(self):
+        app_settings.URLI18N_INCLUDE_CACHE_SIZE = 3
+        for path in ('/home/', '/home/', '/articles/2011/01/', '/articles/2012/02/', '/unknown/'):
+            utils.is_included_path(path)
+        info = utils.cache_info('include_path')
+        self.assertEqual((info['hits'], info['misses'], info['evictions'], info['size']), (1, 4, 1, 3))
+        self.assertTrue(utils.is_included_path('/articles/2012/02/'))
+        self.assertFalse(utils.is_included_path('/unknown/'))
+        #the strict and non-strict mode are cached separately
+        self.assertTrue(utils.is_included_path('/home/blog/', strict_mode=False))
+        self.assertFalse(utils.is_included_path('/home/blog/'))
         
+    def test_decision_cache_normalize_digits(self):
+        app_settings.URLI18N_INCLUDE_CACHE_SIZE = 10
+        app_settings.URLI18N_INCLUDE_CACHE_NORMALIZE_DIGITS = True
+        for path in ('/articles/2011/01/', '/articles/2012/02/', '/articles/11/01/'):
+            utils.is_included_path(path)
+        info = utils.cache_info('include_path')
+        self.assertEqual((info['hits'], info['misses'], info['size']), (1, 2, 2))
+        self.assertFalse(utils.is_included_path('/articles/11/01/'))
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""Benchmark of ``UrlPathTransformMiddleware`` under concurrent
+requests, with and without ``URLI18N_SCOPE_LANGUAGE``. Every thread
+requests ``/<language>/home/`` for rotating languages through the
+WSGI handler and counts the requests after which another language
+than the one of the thread is left active. Run it with:
+
+::
+
+    python urli18n/tests/benchmark.py [requests] [threads ...]
+"""
+
+import sys
+import time
+import threading
+
+from django.conf import settings
+
+if not settings.configured:
+    settings.configure(
+        ROOT_URLCONF='urli18n.tests.urls',
+        MIDDLEWARE_CLASSES=('urli18n.middleware.UrlPathTransformMiddleware',),
+        INSTALLED_APPS=('urli18n',),
+        LANGUAGE_CODE='en',
+        LANGUAGES=(('de', 'Deutsch'), ('en', 'English'), ('zh-cn', 'Chinese')),
+        URLI18N_INCLUDE_PATHS=['/', 'home/'],
+    )
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.test.client import RequestFactory
+from django.utils import translation
+
+from urli18n import app_settings
+
+
+def run(requests, threads, scope_language):
+    """Serves ``requests`` requests on ``threads`` threads and
+    returns the requests per second and the number of leaked
+    languages."""
+    app_settings.URLI18N_SCOPE_LANGUAGE = scope_language
+    handler = WSGIHandler()
+    languages = [code for code, name in settings.LANGUAGES]
+    leaked = []
+    
+    def serve(number):
+        translation.activate(settings.LANGUAGE_CODE)
+        for i in range(requests // threads):
+            language = languages[(number + i) % len(languages)]
+            handler(RequestFactory().get('/%s/home/' % language).environ, lambda status, headers: None)
+            if translation.get_language() != settings.LANGUAGE_CODE:
+                leaked.append(language)
+    
+    workers = [threading.Thread(target=serve, args=(number,)) for number in range(threads)]
+    start = time.time()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = max(time.time() - start, 0.000001)
+    return (requests // threads) * threads / elapsed, len(leaked)
+
+def main(args):
+    requests = args and int(args[0]) or 2000
+    thread_counts = [int(arg) for arg in args[1:]] or [1, 8]
+    #warm up the url conf and the caches
+    run(len(thread_counts) * 10, 1, False)
+    for scope_language in (False, True):
+        for threads in thread_counts:
+            per_second, leaked = run(requests, threads, scope_language)
+            print 'URLI18N_SCOPE_LANGUAGE=%s threads=%d: %.0f requests/s, %d leaked languages' % (
+                scope_language, threads, per_second, leaked)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
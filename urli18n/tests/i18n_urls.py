@@ -0,0 +1,5 @@
+# -*- coding: utf-8 -*-
+
+from urli18n.urls import language_prefixed_urlpatterns
+
+urlpatterns = language_prefixed_urlpatterns('urli18n.tests.urls')
@@ -2,9 +2,26 @@
 
 from django.conf.urls.defaults import patterns, include, url
 
+from urli18n.sitemaps import I18nSitemap
+
+
+class PathSitemap(I18nSitemap):
+    changefreq = 'daily'
+    
+    def items(self):
+        return ['/', '/home/', '/articles/2011/11/']
+    
+    def location(self, obj):
+        return obj
+
+sitemaps = {'pages': PathSitemap}
+
 urlpatterns = patterns('',
     url(r'^$', 'urli18n.tests.views.view1'),
     url(r'^home/$', 'urli18n.tests.views.view2'),
+    url(r'^who/$', 'urli18n.tests.views.who'),
     url(r'^articles/(\d{4})/(\d{2})/$', 'urli18n.tests.views.view3'),
     url(r'^articles/(?P<year>\d{4})/(?P<month>\d{2})/(?P<day>\d+)/$', 'urli18n.tests.views.view4'),
+    url(r'^sitemap\.xml$', 'urli18n.sitemaps.index', {'sitemaps': sitemaps}),
+    url(r'^sitemap-(?P<section>.+)\.xml$', 'urli18n.sitemaps.sitemap', {'sitemaps': sitemaps}),
 )
\ No newline at end of file
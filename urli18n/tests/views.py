@@ -13,3 +13,6 @@ def view3(request, year, month):
 
 def view4(request, year, month, day):
     return http.HttpResponse('%s-%s-%s' % (year, month, day))
+
+def who(request):
+    return http.HttpResponse('user=%s' % request.session.get('user', ''))
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+import re
+
+from django.core import urlresolvers
+
+from urli18n import utils
+
+
+"""The name of the keyword argument the language prefix is
+captured in. It is removed from the view keyword arguments
+by ``UrlPathTransformMiddleware.process_view``.
+"""
+LANGUAGE_KWARG = 'urli18n_language'
+
+
+def language_prefixed_urlpatterns(urlconf_name):
+    """Builds the url patterns for a url conf which resolves
+    url path's with a language prefix on its own. All patterns of
+    the url conf given by ``urlconf_name`` are wrapped in one resolver
+    matching the language prefix for all languages in ``settings.LANGUAGES``,
+    followed by the original patterns. Use it in the module set as
+    ``ROOT_URLCONF`` together with ``URLI18N_DISPATCH_MODE = 'urlconf'``:
+    
+    ::
+        
+        from urli18n.urls import language_prefixed_urlpatterns
+        
+        urlpatterns = language_prefixed_urlpatterns('myproject.urls')
+    
+    Which url path's are served with language prefix is decided
+    by ``UrlPathTransformMiddleware.process_view`` with the same
+    ``utils.is_included_path`` check the middleware redirects with,
+    url path's which are not included raise a 404 there.
+    
+    Args:
+        - ``urlconf_name``: the url conf (module path or module) containing the original url patterns
+        
+    Returns:
+        - a list of url patterns
+    """
+    url_patterns = urlresolvers.RegexURLResolver(r'^/', urlconf_name).url_patterns
+    return [LanguagePrefixResolver(list(url_patterns))] + list(url_patterns)
+
+
+class LanguagePrefixResolver(urlresolvers.RegexURLResolver):
+    """A url resolver matching the language prefix of a url path
+    for all languages in ``settings.LANGUAGES``. The language is
+    passed to the view keyword arguments as ``LANGUAGE_KWARG``. The
+    expression is compiled once and only compiled again if
+    ``settings.LANGUAGES`` is replaced.
+    """
+    
+    def __init__(self, urlconf_name, default_kwargs=None):
+        self._language_codes = None
+        super(LanguagePrefixResolver, self).__init__(r'^', urlconf_name, default_kwargs)
+    
+    def _get_regex(self):
+        language_codes = utils.get_language_codes()
+        if self._language_codes is not language_codes:
+            language_codes_exp = '|'.join([re.escape(code) for code in sorted(language_codes, key=len, reverse=True)])
+            self._regex = re.compile(r'^(?P<%s>%s)/' % (LANGUAGE_KWARG, language_codes_exp), re.UNICODE)
+            self._language_codes = language_codes
+        return self._regex
+    
+    def _set_regex(self, regex):
+        #the expression is always built from settings.LANGUAGES
+        pass
+    regex = property(_get_regex, _set_regex)
@@ -2,8 +2,11 @@
 
 import re
 import urlparse
+import hashlib
+import threading
 
 from django.core import exceptions
+from django.core import urlresolvers
 from django.utils import importlib
 from django.utils import translation
 from django.conf import settings
@@ -11,6 +14,12 @@ from django.conf import settings
 from urli18n import app_settings
 
 
+PATH_MIDDLEWARE = 'urli18n.middleware.UrlPathTransformMiddleware'
+QUERYSTRING_MIDDLEWARE = 'urli18n.middleware.UrlQuerystringTransformMiddleware'
+HOST_MIDDLEWARE = 'urli18n.middleware.UrlHostTransformMiddleware'
+LOCALE_MIDDLEWARE = 'django.middleware.locale.LocaleMiddleware'
+
+
 def show_language(language):
     """Simple helper method to determine if the language
     passed should be shown in the url or not according to 
@@ -25,6 +34,143 @@ def show_language(language):
     """
     return not (app_settings.URLI18N_ALWAYS_SHOW_LANGUAGE is False and language == settings.LANGUAGE_CODE)
 
+def get_middleware_classes():
+    """Returns the list of middleware classes used by the project,
+    which is the ``MIDDLEWARE`` setting of newer Django versions if
+    it is set, else ``MIDDLEWARE_CLASSES``.
+    
+    Returns:
+        - a list or tuple of string representations of middleware classes
+    """
+    middleware_classes = getattr(settings, 'MIDDLEWARE', None)
+    if middleware_classes is None:
+        middleware_classes = settings.MIDDLEWARE_CLASSES
+    return middleware_classes
+
+def get_middleware_mode():
+    """Helper to determine which of the middleware classes
+    provided by urli18n is used. The result is reused until
+    the middleware setting is replaced.
+    
+    Returns:
+        - ``'path'`` if ``UrlPathTransformMiddleware`` is used, ``'querystring'`` if ``UrlQuerystringTransformMiddleware`` is used, ``'host'`` if ``UrlHostTransformMiddleware`` is used, else ``None``
+    """
+    middleware_classes = get_middleware_classes()
+    if _middleware_mode[0] is not middleware_classes:
+        mode = None
+        if PATH_MIDDLEWARE in middleware_classes:
+            mode = 'path'
+        elif QUERYSTRING_MIDDLEWARE in middleware_classes:
+            mode = 'querystring'
+        elif HOST_MIDDLEWARE in middleware_classes:
+            mode = 'host'
+        _middleware_mode[:] = [middleware_classes, mode]
+    return _middleware_mode[1]
+
+_middleware_mode = [None, None]
+
+def get_transform_settings():
+    """Helper returning the settings which affect the result of
+    ``transform_path`` besides the path and the active language.
+    It can be used as part of a key when caching transformed paths.
+    
+    Returns:
+        - a hashable tuple
+    """
+    return (get_middleware_mode(), get_include_matcher(strict_mode=False),
+            app_settings.URLI18N_ALWAYS_SHOW_LANGUAGE, settings.LANGUAGE_CODE,
+            app_settings.URLI18N_QUERYSTRING_NAME, _get_hosts()[3])
+
+def get_language_codes():
+    """Returns the language shortcuts from ``settings.LANGUAGES``
+    as a frozenset. The set is built once and reused until
+    ``settings.LANGUAGES`` is replaced.
+    
+    Returns:
+        - a frozenset of language shortcuts
+    """
+    languages = settings.LANGUAGES
+    if _language_codes[0] is not languages:
+        _language_codes[:] = [languages, frozenset([lang[0] for lang in languages])]
+    return _language_codes[1]
+
+_language_codes = [None, frozenset()]
+
+def get_language_host(language):
+    """Returns the host of a language from ``URLI18N_HOSTS``.
+    
+    Returns:
+        - the host, or None if no host is set for the language
+    """
+    return _get_hosts()[1].get(language)
+
+def get_host_language(host):
+    """Returns the language of a host from ``URLI18N_HOSTS``,
+    looked up in a dictionary built once per setting. Hosts
+    are compared case-insensitive, with or without port.
+    
+    Params:
+        - ``host``: the host, for example from ``request.get_host()``
+    
+    Returns:
+        - the language shortcut, or None if the host is unknown
+    """
+    host_languages = _get_hosts()[2]
+    host = host.lower()
+    language = host_languages.get(host)
+    if language is None and ':' in host:
+        language = host_languages.get(host.rsplit(':', 1)[0])
+    return language
+
+def _get_hosts():
+    """Private helper returning the ``URLI18N_HOSTS`` setting, the
+    language to host and host to language dictionaries and a hashable
+    version of the setting. They are built once per setting object."""
+    hosts = app_settings.URLI18N_HOSTS
+    if _hosts[0] is not hosts:
+        language_hosts = dict(hosts)
+        host_languages = dict([(host.lower(), language) for language, host in hosts.items()])
+        _hosts[:] = [hosts, language_hosts, host_languages, frozenset(language_hosts.items())]
+    return _hosts
+
+_hosts = [None, {}, {}, frozenset()]
+
+def get_language_prefix(path):
+    """Helper to get the first segment of a url path, which
+    is the language shortcut if the path is prefixed with one.
+    Only segments followed by a slash are considered, the same
+    as the ``^/[-\w]+/`` expression used before. The segment is
+    not checked against ``settings.LANGUAGES``, so codes of any
+    length (e.g. ``zh-hant-tw``) are handled.
+    
+    Params:
+        - ``path``: the url path which should be checked
+    
+    Returns:
+        - the first segment of the path or ``None`` if the path has no such segment
+    """
+    end = path.find('/', 1)
+    if end > 1 and path[0] == '/':
+        return path[1:end]
+    return None
+
+def is_internal_referer(referer, host):
+    """Helper to determine if the referer of a request is
+    a page from the same host, which means the user is navigating
+    on the site and not coming from an outside source.
+    
+    Params:
+        - ``referer``: the value of the ``HTTP_REFERER`` header or ``None``
+        - ``host``: the host of the current request (``request.get_host()``)
+    
+    Returns:
+        A Boolean: ``True`` if the referer is a http(s) url on ``host``, ``False`` otherwise
+    """
+    if not referer:
+        return False
+    scheme, netloc = urlparse.urlsplit(referer)[:2]
+    return scheme in ('http', 'https') and netloc.lower() == host.lower()
+
 def is_included_path(path, strict_mode=True):
     """Helper to determine if a given path should be
     transformed to the show the language in the url. This
@@ -40,17 +186,135 @@ def is_included_path(path, strict_mode=True):
         A Boolean: ``True`` if the given url path should be included,
         ``False`` otherwise.
     """
-    path = urlparse.urlparse(path).path
+    #plain absolute paths don't need to be parsed
+    if path[:1] != '/' or path[:2] == '//' or '?' in path or '#' in path or ';' in path:
+        path = urlparse.urlparse(path).path
     media_url = getattr(settings, 'MEDIA_URL')
     static_url = getattr(settings, 'STATIC_URL')
     if not (media_url and path.startswith(media_url))\
     and not (static_url and path.startswith(static_url)):
-        for p in app_settings.URLI18N_INCLUDE_PATHS:
-            p = _edit_path_exp(p, strict_mode)
-            regex_path = re.compile(p, re.UNICODE)
+        matcher = get_include_matcher(strict_mode)
+        cache_size = app_settings.URLI18N_INCLUDE_CACHE_SIZE
+        if not cache_size:
+            return matcher.match(path)
+        cache = get_lru_cache('include_path', cache_size)
+        if app_settings.URLI18N_INCLUDE_CACHE_NORMALIZE_DIGITS:
+            key = (_DIGITS_SEGMENT_REGEX.sub(_normalize_digits, path), matcher)
+        else:
+            key = (path, matcher)
+        included = cache.get(key)
+        if included is None:
+            included = matcher.match(path)
+            cache.set(key, included)
+        return included
+    return False
+
+_DIGITS_SEGMENT_REGEX = re.compile(r'(?<=/)\d+(?=/|$)')
+
+def _normalize_digits(match):
+    return '0' * len(match.group())
+
+def get_include_matcher(strict_mode=True):
+    """Returns the ``IncludePathMatcher`` for the current
+    ``URLI18N_INCLUDE_PATHS`` setting. The matcher is built once
+    per mode and reused until the setting is replaced by another
+    list or tuple (changing the list in place is not detected).
+    
+    Params:
+        - ``strict_mode``: a boolean indicating strict or non-strict mode, see ``_edit_path_exp``
+    
+    Returns:
+        - an ``IncludePathMatcher`` instance
+    """
+    strict_mode = strict_mode is True
+    path_expressions = app_settings.URLI18N_INCLUDE_PATHS
+    matcher = _include_matchers.get(strict_mode)
+    if matcher is None or matcher.path_expressions is not path_expressions:
+        matcher = IncludePathMatcher(path_expressions, strict_mode)
+        _include_matchers[strict_mode] = matcher
+    return matcher
+
+_include_matchers = {}
+
+
+class IncludePathMatcher(object):
+    """Precompiled matcher for the expressions given in
+    ``URLI18N_INCLUDE_PATHS``. Every expression is normalized via
+    ``_edit_path_exp`` and sorted into one of three tiers:
+    
+    - ``literals``: expressions matching exactly one path (for example ``^/home/$``), checked with a set lookup
+    - ``prefixes``: expressions matching every path starting with a literal (for example ``^/home`` in non-strict mode), checked by walking a prefix trie
+    - ``regex``: all other expressions, combined into one alternation
+    
+    Expressions which can't be part of the alternation (back references
+    or inline flags) are kept in ``fallback_regexes`` and tried one by one.
+    """
+    
+    def __init__(self, path_expressions, strict_mode=True):
+        self.path_expressions = path_expressions
+        self.strict_mode = strict_mode
+        literals = set()
+        self.prefixes = {}
+        alternatives = []
+        self.fallback_regexes = []
+        for path_expression in path_expressions:
+            path_expression = _edit_path_exp(path_expression, strict_mode)
+            literal = _literal_path_exp(path_expression)
+            if literal is not None:
+                path, anchored = literal
+                if anchored:
+                    literals.add(path)
+                else:
+                    self._add_prefix(path)
+                continue
+            alternative = _uncapture_path_exp(path_expression)
+            if alternative is None:
+                self.fallback_regexes.append(re.compile(path_expression, re.UNICODE))
+            else:
+                alternatives.append(alternative)
+        self.literals = frozenset(literals)
+        self.regex = None
+        if alternatives:
+            self.regex = re.compile('|'.join(['(?:%s)' % a for a in alternatives]), re.UNICODE)
+    
+    def _add_prefix(self, path):
+        node = self.prefixes
+        for char in path:
+            node = node.setdefault(char, {})
+        node[None] = True
+    
+    def _match_prefix(self, path):
+        node = self.prefixes
+        for char in path:
+            if None in node:
+                return True
+            node = node.get(char)
+            if node is None:
+                return False
+        return None in node
+    
+    def match(self, path):
+        """Checks a url path (without query string) against all tiers.
+        
+        Params:
+            - ``path``: the url path which should be checked
+        
+        Returns:
+            A Boolean: ``True`` if any of the expressions matches, ``False`` otherwise
+        """
+        if path in self.literals:
+            return True
+        #``$`` also matches in front of a trailing newline
+        if path.endswith('\n') and path[:-1] in self.literals:
+            return True
+        if self.prefixes and self._match_prefix(path):
+            return True
+        if self.regex is not None and self.regex.match(path):
+            return True
+        for regex_path in self.fallback_regexes:
             if regex_path.match(path):
                 return True
-    return False
+        return False
 
 def _edit_path_exp(path_expression, strict_mode=True):
     """Private helper function transform a regular expression
@@ -85,6 +349,406 @@ def _edit_path_exp(path_expression, strict_mode=True):
                 path_expression = '%s/$' % path_expression
     return path_expression
 
+class LRUCache(object):
+    """A thread-safe, bounded cache which discards the least
+    recently used entries first. It keeps statistics about hits,
+    misses and evictions, see ``info``.
+    """
+    
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self.clear()
+        
+    def clear(self):
+        """Removes all entries, the statistics are kept."""
+        self._lock.acquire()
+        try:
+            self._data = {}
+            #circular doubly linked list of [previous, next, key, value]
+            #links, the most recently used link is root[0]
+            self._root = []
+            self._root[:] = [self._root, self._root, None, None]
+        finally:
+            self._lock.release()
+    
+    def get(self, key, default=None):
+        """Returns the value cached for ``key`` or ``default``."""
+        self._lock.acquire()
+        try:
+            link = self._data.get(key)
+            if link is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._unlink(link)
+            self._link(link)
+            return link[3]
+        finally:
+            self._lock.release()
+    
+    def set(self, key, value):
+        """Caches ``value`` for ``key``, evicting the least recently
+        used entry if the cache is full."""
+        if self.maxsize <= 0:
+            return
+        self._lock.acquire()
+        try:
+            link = self._data.get(key)
+            if link is not None:
+                self._unlink(link)
+                link[3] = value
+            else:
+                if len(self._data) >= self.maxsize:
+                    oldest = self._root[1]
+                    self._unlink(oldest)
+                    del self._data[oldest[2]]
+                    self.evictions += 1
+                link = [None, None, key, value]
+                self._data[key] = link
+            self._link(link)
+        finally:
+            self._lock.release()
+    
+    def info(self):
+        """Returns a dictionary with the statistics of the cache
+        (``hits``, ``misses``, ``evictions``, ``size`` and ``maxsize``)."""
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'size': len(self._data), 'maxsize': self.maxsize}
+    
+    def __len__(self):
+        return len(self._data)
+    
+    def _link(self, link):
+        root = self._root
+        last = root[0]
+        link[0], link[1] = last, root
+        last[1] = root[0] = link
+    
+    def _unlink(self, link):
+        previous, following = link[0], link[1]
+        previous[1], following[0] = following, previous
+
+def get_lru_cache(name, maxsize):
+    """Returns the process wide ``LRUCache`` registered as ``name``.
+    A new cache is created if none exists yet or if ``maxsize``
+    differs from the size of the existing one.
+    
+    Params:
+        - ``name``: the name of the cache
+        - ``maxsize``: the maximum number of entries of the cache
+    
+    Returns:
+        - an ``LRUCache`` instance
+    """
+    cache = _lru_caches.get(name)
+    if cache is None or cache.maxsize != maxsize:
+        cache = _lru_caches[name] = LRUCache(maxsize)
+    return cache
+
+def cache_info(name):
+    """Returns the statistics of the process wide ``LRUCache``
+    registered as ``name`` (see ``LRUCache.info``) or ``None`` if
+    the cache is not used.
+    """
+    cache = _lru_caches.get(name)
+    if cache is None:
+        return None
+    return cache.info()
+
+def clear_caches():
+    """Removes all process wide ``LRUCache`` instances, e.g. after
+    the url conf was reloaded in tests."""
+    _lru_caches.clear()
+
+_lru_caches = {}
+
+def get_page_cache():
+    """Returns the cache used for the per-language page cache, see
+    ``URLI18N_PAGE_CACHE``. The cache is looked up once and reused
+    until the setting is changed.
+    
+    Returns:
+        - a django cache instance, or None if the page cache is disabled
+    """
+    backend = app_settings.URLI18N_PAGE_CACHE
+    if not backend:
+        return None
+    if _page_cache[0] != backend:
+        from django.core.cache import get_cache
+        _page_cache[:] = [backend, get_cache(backend)]
+    return _page_cache[1]
+
+_page_cache = [None, None]
+
+def redirect_vary_headers(cause, language_in_url=False):
+    """Returns the headers a redirect of the middleware classes
+    varies on, according to the cause of the redirect (see
+    ``URLI18N_REDIRECT_STATUS``). All redirects depend on the negotiated
+    language. Redirects of url's containing a language (``'switch'``,
+    ``'default'`` and the ``'slash'`` or ``'canonical'`` redirects of
+    those url's) depend on the ``Referer`` as well, since a visitor
+    navigating on the site keeps the active language instead of the
+    one of the url.
+    
+    Params:
+        - ``cause``: the cause of the redirect
+        - ``language_in_url``: True if the requested url contains a language
+    
+    Returns:
+        - a tuple of header names
+    """
+    if language_in_url or cause in ('switch', 'default'):
+        return ('Accept-Language', 'Cookie', 'Referer')
+    return ('Accept-Language', 'Cookie')
+
+def page_cache_key(host, secure, language, path, querystring_parts):
+    """Builds the key of a page in the per-language page cache.
+    The order of the query string parameters doesn't matter.
+    
+    Params:
+        - ``host``: the host of the request
+        - ``secure``: True for https requests
+        - ``language``: the language of the page
+        - ``path``: the url path without language
+        - ``querystring_parts``: the query string parameters (``'name=value'``) without language
+    
+    Returns:
+        - the cache key
+    """
+    querystring = '&'.join(sorted([part for part in querystring_parts if part]))
+    key = '\n'.join([host, secure and 'https' or 'http', language, path, querystring])
+    return 'urli18n.page.%s' % hashlib.md5(key.encode('utf-8') if isinstance(key, unicode) else key).hexdigest()
+
+def is_cacheable_response(response):
+    """Helper to determine if a response may be stored in the
+    per-language page cache. Only complete ``200`` responses which
+    don't set cookies, aren't private and don't vary on other request
+    headers than ``Accept-Language`` are cached, since the cache key
+    only holds the host, the language and the url.
+    
+    Params:
+        - ``response``: the django response object
+    
+    Returns:
+        A Boolean: ``True`` if the response may be cached, ``False`` otherwise.
+    """
+    if response.status_code != 200 or getattr(response, 'streaming', False)\
+    or not getattr(response, '_is_string', True) or response.cookies:
+        return False
+    cache_control = response.get('Cache-Control', '').lower()
+    if 'private' in cache_control or 'no-store' in cache_control or 'no-cache' in cache_control:
+        return False
+    vary = [header.strip().lower() for header in response.get('Vary', '').split(',')]
+    return not [header for header in vary if header and header != 'accept-language']
+
+def is_session_dependent(request):
+    """Helper to determine if the response of a request may depend
+    on the visitor although it doesn't vary on cookies yet. The
+    ``Vary: Cookie`` header and the cookies of the session, the
+    authentication and the CSRF protection are added by the
+    ``process_response`` methods of their middleware classes, which
+    run after the one of the urli18n middleware classes when they are
+    listed before them. So the request is checked instead: a session
+    which was accessed or modified, a user which was looked up or a
+    CSRF token which was used.
+    
+    Params:
+        - ``request``: the django request object
+    
+    Returns:
+        A Boolean: ``True`` if the response may depend on the visitor, ``False`` otherwise.
+    """
+    session = getattr(request, 'session', None)
+    if session is not None and (getattr(session, 'accessed', False) or getattr(session, 'modified', False)):
+        return True
+    return hasattr(request, '_cached_user') or bool(request.META.get('CSRF_COOKIE_USED'))
+
+def resolve(path):
+    """Resolves a url path via ``django.core.urlresolvers.resolve``.
+    If ``URLI18N_RESOLVE_CACHE_SIZE`` is set the result is kept in
+    the ``'resolve'`` LRU cache, keyed by the path and the url conf.
+    Cached results are ignored once the url conf is reloaded.
+    
+    Params:
+        - ``path``: the url path which should be resolved
+    
+    Returns:
+        - a tuple ``(view, args, kwargs)``
+    """
+    cache_size = app_settings.URLI18N_RESOLVE_CACHE_SIZE
+    if not cache_size:
+        view, args, kwargs = urlresolvers.resolve(path)
+        return view, args, kwargs
+    urlconf = urlresolvers.get_urlconf() or settings.ROOT_URLCONF
+    resolver = urlresolvers.get_resolver(urlconf)
+    cache = get_lru_cache('resolve', cache_size)
+    #the resolver is kept in the cached value, so its id is not reused
+    key = (path, urlconf, id(resolver))
+    cached = cache.get(key)
+    if cached is None:
+        view, args, kwargs = resolver.resolve(path)
+        cached = (resolver, view, args, kwargs)
+        cache.set(key, cached)
+    #views may change their keyword arguments
+    return cached[1], cached[2], dict(cached[3])
+
+def append_slash(path):
+    """Adds a trailing slash to the url path if Django's
+    ``CommonMiddleware`` would redirect to it because of
+    the ``APPEND_SLASH`` setting, so the middleware classes
+    can redirect to the final url path in one step. Only url
+    path's included by ``URLI18N_INCLUDE_PATHS`` with slash are
+    resolved, all others (like ``/favicon.ico``) are returned
+    right away and left to ``CommonMiddleware``.
+    
+    Params:
+        - ``path``: the url path without language
+    
+    Returns:
+        - the url path, with a trailing slash if needed
+    """
+    if path.endswith('/') or not getattr(settings, 'APPEND_SLASH', False)\
+    or 'django.middleware.common.CommonMiddleware' not in get_middleware_classes()\
+    or not is_included_path(path + '/'):
+        return path
+    if _is_valid_path(path) or not _is_valid_path(path + '/'):
+        return path
+    return path + '/'
+
+def _is_valid_path(path):
+    """Private helper function checking if a url path resolves."""
+    try:
+        resolve(path)
+    except urlresolvers.Resolver404:
+        return False
+    return True
+
+def reverse(viewname, urlconf=None, args=None, kwargs=None, current_app=None, language=None):
+    """Reverses a url via ``django.core.urlresolvers.reverse`` and
+    transforms the result via ``transform_path`` in one step. The
+    results are kept in the ``'reverse'`` LRU cache (see
+    ``URLI18N_REVERSE_CACHE_SIZE``), keyed by all arguments, the
+    language and the settings affecting ``transform_path``.
+    
+    Params:
+        - ``viewname``, ``urlconf``, ``args``, ``kwargs``, ``current_app``: see ``django.core.urlresolvers.reverse``
+        - ``language``: the language shortcut the url should be transformed for, defaults to the active language
+    
+    Returns:
+        - the transformed url path
+    """
+    if language is None:
+        language = translation.get_language()
+    cache_size = app_settings.URLI18N_REVERSE_CACHE_SIZE
+    if cache_size:
+        resolver = urlresolvers.get_resolver(urlconf or urlresolvers.get_urlconf())
+        key = (viewname, urlconf, tuple(args or ()), tuple(sorted((kwargs or {}).items())), current_app,
+               language, urlresolvers.get_script_prefix(), id(resolver), get_transform_settings())
+        try:
+            cache = get_lru_cache('reverse', cache_size)
+            cached = cache.get(key)
+        except TypeError:
+            #unhashable arguments can't be cached
+            cache = cached = None
+        if cached is not None:
+            return cached[1]
+    path = transform_path(urlresolvers.reverse(viewname, urlconf, args, kwargs, current_app=current_app), language)
+    if cache_size and cache is not None:
+        #the resolver is kept in the cached value, so its id is not reused
+        cache.set(key, (resolver, path))
+    return path
+
+_REGEX_SPECIAL_CHARS = frozenset('.^$*+?{}[]\\|()')
+
+def _literal_path_exp(path_expression):
+    """Private helper function which checks if a path expression
+    (as returned by ``_edit_path_exp``) matches literal paths only.
+    
+    Params:
+        - ``path_expression``: a regular expression starting with ``^``
+    
+    Returns:
+        - ``None`` if the expression uses regular expression syntax, else a tuple ``(path, anchored)``, where ``anchored`` is ``True`` if the expression ends with ``$``
+    """
+    chars = []
+    anchored = False
+    i, length = 1, len(path_expression)
+    while i < length:
+        char = path_expression[i]
+        if char == '\\':
+            escaped = path_expression[i + 1:i + 2]
+            if not escaped or escaped.isalnum():
+                return None
+            chars.append(escaped)
+            i += 2
+            continue
+        if char == '$' and i == length - 1:
+            anchored = True
+        elif char in _REGEX_SPECIAL_CHARS:
+            return None
+        else:
+            chars.append(char)
+        i += 1
+    return ''.join(chars), anchored
+
+def _uncapture_path_exp(path_expression):
+    """Private helper function which turns all groups of a
+    path expression into non-capturing groups, so it can be
+    combined with other expressions into one alternation without
+    running into duplicate group names or the group limit of ``re``.
+    
+    Params:
+        - ``path_expression``: a regular expression
+    
+    Returns:
+        - the rewritten expression or ``None`` if the expression relies on groups (back references, conditionals) or sets inline flags
+    """
+    chars = []
+    in_class = False
+    i, length = 0, len(path_expression)
+    while i < length:
+        char = path_expression[i]
+        if char == '\\':
+            if not in_class and path_expression[i + 1:i + 2].isdigit():
+                return None
+            chars.append(path_expression[i:i + 2])
+            i += 2
+            continue
+        if in_class:
+            if char == ']':
+                in_class = False
+        elif char == '[':
+            in_class = True
+            chars.append(char)
+            i += 1
+            #a leading "^" and "]" are part of the character class
+            if path_expression[i:i + 1] == '^':
+                chars.append('^')
+                i += 1
+            if path_expression[i:i + 1] == ']':
+                chars.append(']')
+                i += 1
+            continue
+        elif char == '(':
+            if path_expression.startswith('(?P<', i):
+                chars.append('(?:')
+                i = path_expression.index('>', i) + 1
+                continue
+            if not path_expression.startswith('(?', i):
+                chars.append('(?:')
+                i += 1
+                continue
+            modifier = path_expression[i + 2:i + 3]
+            if modifier in ('(', 'P') or modifier in 'iLmsux':
+                return None
+        chars.append(char)
+        i += 1
+    return ''.join(chars)
+
 def process_missing_requests(middleware_object, request):
     """Processes every ``process_request`` method from
     all middleware's which follow this middleware within 
@@ -97,20 +761,10 @@ def process_missing_requests(middleware_object, request):
     Returns:
         - if a ``process_request`` call returns an HttpResponse it will return this response, else None
     """
-    middleware_string = _create_middleware_string(middleware_object)
-    middleware_tuple = []
-    middleware_appeared = False
-    for middleware_path in settings.MIDDLEWARE_CLASSES:
-        if middleware_appeared is True:
-            middleware_tuple.append(middleware_path)
-        if middleware_appeared is False and middleware_path==middleware_string:
-            middleware_appeared = True
-    middlware_instances = _init_middleware_classes(middleware_tuple)
-    for mw_instance in middlware_instances:
-        if hasattr(mw_instance, 'process_request'):
-            process_result = mw_instance.process_request(request)
-            if process_result is not None:
-                return process_result
+    for process_request in _get_middleware_pipeline(middleware_object)[1]:
+        process_result = process_request(request)
+        if process_result is not None:
+            return process_result
     return None
 
 def process_missing_views(middleware_object, request, view_func, view_args, view_kwargs):
@@ -130,14 +784,45 @@ def process_missing_views(middleware_object, request, view_func, view_args, view
    Returns:
         - if a ``process_view`` call returns an HttpResponse it will return this response, else None
     """
-    middlware_instances = _init_middleware_classes(settings.MIDDLEWARE_CLASSES)
-    for mw_instance in middlware_instances:
-        if hasattr(mw_instance, 'process_view'):
-            process_result = mw_instance.process_view(request, view_func, view_args, view_kwargs)
-            if process_result is not None:
-                return process_result
+    for process_view in _get_middleware_pipeline(middleware_object)[2]:
+        process_result = process_view(request, view_func, view_args, view_kwargs)
+        if process_result is not None:
+            return process_result
     return None
 
+def _get_middleware_pipeline(middleware_object):
+    """A helper function which initializes the middleware classes
+    needed by ``process_missing_requests`` and ``process_missing_views``
+    once per middleware object. The result is stored on the middleware
+    object and rebuilt only if ``settings.MIDDLEWARE_CLASSES`` is replaced.
+    
+    Args:
+        - ``middleware_object``: the current middleware object
+        
+    Returns:
+        - a tuple containing ``settings.MIDDLEWARE_CLASSES``, a list of the ``process_request`` methods of all middleware's following ``middleware_object`` and a list of the ``process_view`` methods of all middleware's
+    """
+    middleware_classes = settings.MIDDLEWARE_CLASSES
+    pipeline = getattr(middleware_object, '_urli18n_pipeline', None)
+    if pipeline is None or pipeline[0] is not middleware_classes:
+        middleware_string = _create_middleware_string(middleware_object)
+        middleware_classes = list(middleware_classes)
+        if middleware_string in middleware_classes:
+            position = middleware_classes.index(middleware_string)
+            preceding_instances = _init_middleware_classes(middleware_classes[:position])
+            following_instances = _init_middleware_classes(middleware_classes[position + 1:])
+            mw_instances = preceding_instances + [middleware_object] + following_instances
+        else:
+            following_instances = []
+            mw_instances = _init_middleware_classes(middleware_classes)
+        request_methods = [mw_instance.process_request for mw_instance in following_instances
+                           if hasattr(mw_instance, 'process_request')]
+        view_methods = [mw_instance.process_view for mw_instance in mw_instances
+                        if hasattr(mw_instance, 'process_view')]
+        pipeline = (settings.MIDDLEWARE_CLASSES, request_methods, view_methods)
+        middleware_object._urli18n_pipeline = pipeline
+    return pipeline
+
 def _create_middleware_string(middleware_object):
     """A helper function to provide the string for a
     given middleware object which occur within 
@@ -151,6 +836,12 @@ def _create_middleware_string(middleware_object):
     """
     return  '%s.%s' % (middleware_object.__module__, middleware_object.__class__.__name__)
 
+"""The number of middleware instances created by ``_init_middleware_classes``.
+Tests can check this to make sure middleware classes are not initialized
+again for every request.
+"""
+middleware_instance_count = 0
+
 def _init_middleware_classes(middleware_tuple):
     """A helppr function which initialize all middleware
     classes given by their string representation in a tuple 
@@ -164,6 +855,7 @@ def _init_middleware_classes(middleware_tuple):
     Returns:
         - a list of initialized middleware classes
     """
+    global middleware_instance_count
     mw_instances = []
     for middleware_path in middleware_tuple:
         try:
@@ -181,6 +873,7 @@ def _init_middleware_classes(middleware_tuple):
         try:
             mw_instance = mw_class()
             mw_instances.append(mw_instance)
+            middleware_instance_count += 1
         except exceptions.MiddlewareNotUsed:
             continue
     return mw_instances
@@ -201,7 +894,10 @@ def break_full_path(full_path):
             - ``language_querystring_position``: the index of the language_querystring within ``querystring_parts`` if ``language_querystring`` was found, else None
     """
     querystring_name = app_settings.URLI18N_QUERYSTRING_NAME
-    regex_query = re.compile('%s=[-\w]{2,5}' % querystring_name)
+    regex_query = _querystring_regexes.get(querystring_name)
+    if regex_query is None:
+        regex_query = re.compile('%s=[-\w]{2,}' % re.escape(querystring_name))
+        _querystring_regexes[querystring_name] = regex_query
     path_parts = full_path.split('?')
     querystring = ''
     querystring_parts = []
@@ -217,6 +913,8 @@ def break_full_path(full_path):
                 break
     return path_parts, querystring_parts, language_querystring, language_querystring_position
 
+_querystring_regexes = {}
+
 def reconstruct_full_path(path, querystring_parts):
     """Utility function which reconstruct the full_path
     according to new paremeters.
@@ -233,7 +931,33 @@ def reconstruct_full_path(path, querystring_parts):
         full_path = '?'.join([path, '&'.join(querystring_parts)])
     return full_path
 
-def transform_path(path):
+def canonical_querystring(querystring_parts, language_querystring_position=None):
+    """Utility function bringing the query string parameters into
+    a canonical order, so equal urls share one entry in caches. The
+    parameters listed in ``URLI18N_STRIP_QUERYSTRING_PARAMETERS`` and
+    empty parameters are removed, the others are sorted by name (keeping
+    the order of repeated names) and the language parameter comes last.
+    
+    Args:
+        - ``querystring_parts``: the parts of the querystring as a list, see ``break_full_path``
+        - ``language_querystring_position``: the position of the language parameter in ``querystring_parts`` or None
+    
+    Returns:
+        - a tuple of the canonical parts as a list and the new position of the language parameter or None
+    """
+    stripped_names = app_settings.URLI18N_STRIP_QUERYSTRING_PARAMETERS
+    parts = []
+    for i, part in enumerate(querystring_parts):
+        if part and i != language_querystring_position\
+        and part.split('=', 1)[0] not in stripped_names:
+            parts.append(part)
+    parts.sort(key=lambda part: part.split('=', 1)[0])
+    if language_querystring_position is None:
+        return parts, None
+    parts.append(querystring_parts[language_querystring_position])
+    return parts, len(parts) - 1
+
+def transform_path(path, language=None):
     """Utility function used by the template tags
     to transform given url paths according to active
     language. This helps to change already given urls
@@ -242,25 +966,331 @@ def transform_path(path):
     
     Args:
         - ``path``: the url path which should be transformed
+        - ``language``: the language shortcut the path should be transformed for, defaults to the active language
         
     Returns:
         - the transformed url path according to which middleware is used and which settings are set
     """
-    language = translation.get_language()
-    if 'urli18n.middleware.UrlPathTransformMiddleware' in settings.MIDDLEWARE_CLASSES:
+    if language is None:
+        language = translation.get_language()
+    mode = get_middleware_mode()
+    if mode == 'path':
         if show_language(language) and not path.startswith('/%s/' % language)\
         and not path=='/%s' % language and is_included_path(path, strict_mode=False):
             path = '/%s%s' % (language, path)
-    elif 'urli18n.middleware.UrlQuerystringTransformMiddleware' in settings.MIDDLEWARE_CLASSES:
+    elif mode == 'querystring':
         if show_language(language) and is_included_path(path, strict_mode=False):
             language_querystring = '%s=%s' % (app_settings.URLI18N_QUERYSTRING_NAME, language)
-            path_parts = path.split('?')
-            if len(path_parts)==1 or language_querystring not in path_parts[1]:
-                if len(path_parts)==1:
-                    querystring_parts = []
-                else:
-                    querystring_parts = path_parts[1].split('&')
-                querystring_parts.append(language_querystring)
-                path = reconstruct_full_path(path_parts[0], querystring_parts)
+            path = _append_querystring(path, language_querystring)
+    elif mode == 'host':
+        host = get_language_host(language)
+        if host is not None and path[:1] == '/' and path[:2] != '//'\
+        and is_included_path(path, strict_mode=False):
+            path = '//%s%s' % (host, path)
     return path
 
+def _append_querystring(path, language_querystring):
+    """Private helper function appending the language query
+    string parameter to a url path, if it is not given already."""
+    path_parts = path.split('?')
+    if len(path_parts)==1 or language_querystring not in path_parts[1]:
+        if len(path_parts)==1:
+            querystring_parts = []
+        else:
+            querystring_parts = path_parts[1].split('&')
+        querystring_parts.append(language_querystring)
+        path = reconstruct_full_path(path_parts[0], querystring_parts)
+    return path
+
+def transform_paths(paths, language=None):
+    """Utility function transforming many url path's at once,
+    for example to build the links of a newsletter or feed. Works
+    like ``transform_path``, but the middleware mode, the language
+    and the settings are looked up once for the whole batch, when
+    this function is called, so no language has to be activated
+    for the paths and changing the active language while iterating
+    has no effect.
+    
+    Args:
+        - ``paths``: an iterable of url path's which should be transformed
+        - ``language``: the language shortcut the paths should be transformed for, defaults to the active language
+        
+    Returns:
+        - a generator yielding the transformed url path's in the order of ``paths``
+    """
+    if language is None:
+        language = translation.get_language()
+    mode = get_middleware_mode()
+    if mode is None or (mode == 'host' and get_language_host(language) is None)\
+    or (mode != 'host' and not show_language(language)):
+        return iter(paths)
+    excluded_urls = tuple([url for url in (getattr(settings, 'MEDIA_URL'), getattr(settings, 'STATIC_URL')) if url])
+    matcher = get_include_matcher(strict_mode=False)
+    if mode == 'host':
+        return _transform_paths_host(paths, '//%s' % get_language_host(language), matcher, excluded_urls)
+    if mode == 'path':
+        return _transform_paths_prefix(paths, '/%s' % language, matcher, excluded_urls)
+    language_querystring = '%s=%s' % (app_settings.URLI18N_QUERYSTRING_NAME, language)
+    return _transform_paths_querystring(paths, language_querystring, matcher, excluded_urls)
+
+def _is_included_path(path, matcher, excluded_urls):
+    """Private helper function doing the check of ``is_included_path``
+    with an already looked up matcher and excluded urls."""
+    if path[:1] != '/' or path[:2] == '//' or '?' in path or '#' in path or ';' in path:
+        path = urlparse.urlparse(path).path
+    if excluded_urls and path.startswith(excluded_urls):
+        return False
+    return matcher.match(path)
+
+def _transform_paths_prefix(paths, prefix, matcher, excluded_urls):
+    """Private generator function of ``transform_paths``
+    for the path middleware."""
+    prefixed = prefix + '/'
+    for path in paths:
+        if not path.startswith(prefixed) and path != prefix\
+        and _is_included_path(path, matcher, excluded_urls):
+            path = prefix + path
+        yield path
+
+def _transform_paths_host(paths, host, matcher, excluded_urls):
+    """Private generator function of ``transform_paths``
+    for the host middleware."""
+    for path in paths:
+        if path[:1] == '/' and path[:2] != '//'\
+        and _is_included_path(path, matcher, excluded_urls):
+            path = host + path
+        yield path
+
+def _transform_paths_querystring(paths, language_querystring, matcher, excluded_urls):
+    """Private generator function of ``transform_paths``
+    for the query string middleware."""
+    for path in paths:
+        if _is_included_path(path, matcher, excluded_urls):
+            path = _append_querystring(path, language_querystring)
+        yield path
+
+
+def transform_location(location, host, language=None):
+    """Utility function transforming the ``Location`` of a redirect
+    the same way the middleware would redirect the request following it,
+    so the extra redirect is not necessary. Only internal locations
+    (absolute url path's or url's of ``host``) without language which
+    are included by ``URLI18N_INCLUDE_PATHS`` are transformed.
+    
+    Args:
+        - ``location``: the location of the redirect
+        - ``host``: the host of the current request, see ``request.get_host()``
+        - ``language``: the language shortcut the location should be transformed for, defaults to the active language
+        
+    Returns:
+        - the transformed location, or the unchanged location
+    """
+    scheme, netloc, path, query, fragment = urlparse.urlsplit(location)
+    if netloc:
+        if netloc != host or scheme not in ('http', 'https'):
+            return location
+    elif scheme or not path.startswith('/'):
+        return location
+    full_path = path
+    if query:
+        full_path = '%s?%s' % (path, query)
+    if strip_language(full_path) != full_path or not is_included_path(path):
+        return location
+    transformed_netloc, path, query = urlparse.urlsplit(transform_path(full_path, language))[1:4]
+    if transformed_netloc:
+        #moved to the host of the language
+        netloc = transformed_netloc
+    return urlparse.urlunsplit((scheme, netloc, path, query, fragment))
+
+_LINK_REGEX = re.compile(r'(?P<attribute>\b(?:href|action)\s*=\s*)(?P<quote>["\'])(?P<url>[^"\'<>]*)(?P=quote)', re.IGNORECASE)
+
+def rewrite_links(content, language=None):
+    """Utility function rewriting the internal links (``href`` and
+    ``action`` attributes with an absolute url path) of a html snippet
+    with the same rules as ``transform_path``. Like ``transform_location``
+    only links without language whose path is included by
+    ``URLI18N_INCLUDE_PATHS`` (in strict mode, as the middleware
+    matches requests) are rewritten. Links to other hosts, links
+    which already carry a language and relative links are left alone.
+    
+    Args:
+        - ``content``: the html which links should be rewritten
+        - ``language``: the language shortcut the links should be transformed for, defaults to the active language
+        
+    Returns:
+        - the html with rewritten links
+    """
+    urls = [match.group('url').replace('&amp;', '&') for match in _LINK_REGEX.finditer(content)]
+    rewritable = [_is_rewritable_link(url) for url in urls]
+    if True not in rewritable:
+        return content
+    transformed = transform_paths([url for i, url in enumerate(urls) if rewritable[i]], language)
+    rewritable = iter(rewritable)
+    def replace(match):
+        if not rewritable.next():
+            return match.group(0)
+        url = match.group('url')
+        new_url = transformed.next()
+        if '&amp;' in url:
+            new_url = new_url.replace('&', '&amp;')
+        return '%s%s%s%s' % (match.group('attribute'), match.group('quote'), new_url, match.group('quote'))
+    return _LINK_REGEX.sub(replace, content)
+
+def _is_rewritable_link(url):
+    """Private helper function of ``rewrite_links`` checking if
+    a link is an url path without language which is included
+    by ``URLI18N_INCLUDE_PATHS``."""
+    if url[:1] != '/' or url[:2] == '//':
+        return False
+    full_path = url.split('#', 1)[0]
+    return strip_language(full_path) == full_path and is_included_path(full_path.split('?', 1)[0])
+
+class LinkRewriter(object):
+    """Incremental version of ``rewrite_links`` for html which
+    arrives in chunks, like the content of a streaming response.
+    A tag which is cut off at the end of a chunk is kept back until
+    the next chunk arrives (up to ``max_carry`` bytes), so links are
+    never split. Once more than ``budget`` bytes have been rewritten
+    the remaining chunks are passed through unchanged.
+    
+    Usage::
+        
+        rewriter = LinkRewriter('de', budget=1048576)
+        for chunk in rewriter.rewrite(chunks):
+            ...
+    """
+    max_carry = 4096
+    
+    def __init__(self, language=None, budget=0):
+        if language is None:
+            language = translation.get_language()
+        self.language = language
+        self.budget = budget
+        self.consumed = 0
+        self.carry = ''
+    
+    def exhausted(self):
+        """Returns True if the byte budget is used up."""
+        return bool(self.budget) and self.consumed >= self.budget
+    
+    def feed(self, chunk):
+        """Rewrites the links of the next chunk and returns the
+        rewritten html which is complete so far."""
+        data = self.carry + chunk
+        self.carry = ''
+        if self.exhausted():
+            return data
+        self.consumed += len(chunk)
+        position = data.rfind('<')
+        if position != -1 and data.find('>', position) == -1 and len(data) - position <= self.max_carry:
+            data, self.carry = data[:position], data[position:]
+        return rewrite_links(data, self.language)
+    
+    def flush(self):
+        """Returns the html kept back from the last chunk."""
+        data = self.carry
+        self.carry = ''
+        if data and not self.exhausted():
+            data = rewrite_links(data, self.language)
+        return data
+    
+    def rewrite(self, chunks):
+        """Generator rewriting the links of an iterable of chunks."""
+        for chunk in chunks:
+            data = self.feed(chunk)
+            if data:
+                yield data
+        data = self.flush()
+        if data:
+            yield data
+
+def strip_language(full_path):
+    """Utility function which removes the language from a url
+    path (with query string) according to which middleware is used,
+    so it can be transformed for any language afterwards.
+    
+    Args:
+        - ``full_path``: the url path, for example from ``request.get_full_path()``
+        
+    Returns:
+        - the url path without language prefix or language query string parameter
+    """
+    mode = get_middleware_mode()
+    if mode == 'path':
+        language = get_language_prefix(full_path)
+        if language is not None and language in get_language_codes():
+            full_path = full_path[len(language) + 1:]
+    elif mode == 'querystring':
+        path_parts, querystring_parts, language_querystring, language_querystring_position = break_full_path(full_path)
+        if language_querystring_position is not None:
+            querystring_parts.pop(language_querystring_position)
+            full_path = reconstruct_full_path(path_parts[0], querystring_parts)
+    return full_path
+
+def alternate_paths(path):
+    """Utility function returning the url path for every
+    language in ``settings.LANGUAGES``, without activating them.
+    
+    Args:
+        - ``path``: the url path without language (see ``strip_language``)
+        
+    Returns:
+        - a list of ``(language, transformed path)`` tuples, in the order of ``settings.LANGUAGES``
+    """
+    return [(language[0], transform_path(path, language[0])) for language in settings.LANGUAGES]
+
+class PrecomputedPath(object):
+    """The results of ``transform_path`` for a constant url path
+    (e.g. a string literal in a template), computed once for all
+    languages in ``settings.LANGUAGES``. They are computed again only
+    if one of the settings affecting ``transform_path`` changes.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self._compute()
+        
+    def _compute(self):
+        transform_settings = get_transform_settings()
+        language_codes = get_language_codes()
+        transformed_paths = dict([(language, transform_path(self.path, language)) for language in language_codes])
+        self._state = (transform_settings, language_codes, transformed_paths)
+        return self._state
+    
+    def get(self, language=None):
+        """Returns the transformed path for ``language``
+        (defaults to the active language)."""
+        if language is None:
+            language = translation.get_language()
+        state = self._state
+        if state[0] != get_transform_settings() or state[1] is not get_language_codes():
+            state = self._compute()
+        transformed_path = state[2].get(language)
+        if transformed_path is None:
+            transformed_path = transform_path(self.path, language)
+        return transformed_path
+
+def cached_transform_path(path, language=None):
+    """Transforms a url path via ``transform_path`` and keeps
+    the result in the ``'transform_url'`` LRU cache (see
+    ``URLI18N_TRANSFORM_CACHE_SIZE``), keyed by path, language and
+    all settings affecting ``transform_path``.
+    
+    Args:
+        - ``path``: the url path which should be transformed
+        - ``language``: the language shortcut the path should be transformed for, defaults to the active language
+        
+    Returns:
+        - the transformed url path
+    """
+    if language is None:
+        language = translation.get_language()
+    if not isinstance(path, basestring) or not app_settings.URLI18N_TRANSFORM_CACHE_SIZE:
+        return transform_path(path, language)
+    cache = get_lru_cache('transform_url', app_settings.URLI18N_TRANSFORM_CACHE_SIZE)
+    key = (path, language, get_transform_settings())
+    transformed_path = cache.get(key)
+    if transformed_path is None:
+        transformed_path = transform_path(path, language)
+        cache.set(key, transformed_path)
+    return transformed_path
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIRequest, STATUS_CODE_TEXT
+from django.utils import translation
+
+from urli18n import app_settings
+from urli18n import utils
+
+
+SESSION_MIDDLEWARE = 'django.contrib.sessions.middleware.SessionMiddleware'
+COMMON_MIDDLEWARE = 'django.middleware.common.CommonMiddleware'
+
+
+class LanguageRedirectMiddleware(object):
+    """WSGI middleware answering the language redirects of
+    ``UrlPathTransformMiddleware`` and ``UrlQuerystringTransformMiddleware``
+    before Django builds the full request and runs the other middleware
+    classes. It uses the same include rules, languages and redirect settings
+    as the Django middleware classes and passes every other request through
+    to the wrapped application. Wrap the application in your ``wsgi.py``:
+    
+    ::
+    
+        from django.core.handlers.wsgi import WSGIHandler
+        from urli18n.wsgi import LanguageRedirectMiddleware
+        
+        application = LanguageRedirectMiddleware(WSGIHandler())
+    
+    The language is negotiated like ``django.middleware.locale.LocaleMiddleware``
+    does from the language cookie and the ``Accept-Language`` header, so requests
+    are passed through when ``LocaleMiddleware`` is not used or a session cookie is
+    sent (the session may hold another language). Requests are passed through as
+    well when ``CommonMiddleware`` may answer them itself (``PREPEND_WWW`` or
+    ``DISALLOWED_USER_AGENTS`` settings or a missing slash with ``APPEND_SLASH``
+    setting if it comes first), when the application is not mounted at
+    the root (``SCRIPT_NAME``) or when the path is not valid UTF-8.
+    """
+    
+    def __init__(self, application):
+        self.application = application
+    
+    def __call__(self, environ, start_response):
+        redirect = get_redirect(environ)
+        if redirect is None:
+            return self.application(environ, start_response)
+        location, cause, language_in_url = redirect
+        status = app_settings.URLI18N_REDIRECT_STATUS.get(cause, 302)
+        headers = [
+            ('Location', location),
+            ('Content-Type', 'text/html; charset=%s' % settings.DEFAULT_CHARSET),
+            ('Content-Length', '0'),
+        ]
+        if app_settings.URLI18N_REDIRECT_CACHE_CONTROL is not None:
+            headers.append(('Cache-Control', app_settings.URLI18N_REDIRECT_CACHE_CONTROL))
+        vary_headers = utils.redirect_vary_headers(cause, language_in_url)
+        if vary_headers:
+            headers.append(('Vary', ', '.join(vary_headers)))
+        start_response('%d %s' % (status, STATUS_CODE_TEXT.get(status, 'UNKNOWN')), headers)
+        return ['']
+
+
+def get_redirect(environ):
+    """Returns the redirect the activated urli18n middleware
+    would answer the request of ``environ`` with, if it can be
+    determined without running the Django middleware classes.
+    
+    Args:
+        - ``environ``: the WSGI environment of the request
+    
+    Returns:
+        - Either a tuple of the absolute url to redirect to, the cause of the redirect (see ``URLI18N_REDIRECT_STATUS``) and whether the requested url contains a language, or None
+    """
+    if environ.get('REQUEST_METHOD') != 'GET' or environ.get('SCRIPT_NAME'):
+        return None
+    middleware_classes = utils.get_middleware_classes()
+    if utils.LOCALE_MIDDLEWARE not in middleware_classes:
+        return None
+    if COMMON_MIDDLEWARE in middleware_classes\
+    and (settings.PREPEND_WWW or settings.DISALLOWED_USER_AGENTS):
+        return None
+    try:
+        environ.get('PATH_INFO', '').decode('utf-8')
+    except UnicodeDecodeError:
+        return None
+    mode = utils.get_middleware_mode()
+    if mode not in ('path', 'querystring'):
+        return None
+    request = WSGIRequest(environ)
+    if COMMON_MIDDLEWARE in middleware_classes\
+    and list(middleware_classes).index(COMMON_MIDDLEWARE) < list(middleware_classes).index(
+        mode == 'path' and utils.PATH_MIDDLEWARE or utils.QUERYSTRING_MIDDLEWARE)\
+    and utils.append_slash(request.path_info) != request.path_info:
+        #CommonMiddleware redirects to the path with slash itself
+        return None
+    if SESSION_MIDDLEWARE in middleware_classes and settings.SESSION_COOKIE_NAME in request.COOKIES:
+        return None
+    language = translation.get_language_from_request(request)
+    if mode == 'path':
+        redirect = _get_path_redirect(request, language)
+    else:
+        redirect = _get_querystring_redirect(request, language)
+    if redirect is None:
+        return None
+    return (request.build_absolute_uri(redirect[0]),) + redirect[1:]
+
+def _get_path_redirect(request, language):
+    """Private helper function returning the redirect of
+    ``UrlPathTransformMiddleware``, see ``get_redirect``."""
+    path = request.path
+    full_path = request.get_full_path()
+    slashed_path = utils.append_slash(path)
+    if utils.is_included_path(slashed_path) and utils.show_language(language):
+        if slashed_path == path and app_settings.URLI18N_SERVE_IN_PLACE:
+            return None
+        return '/%s%s%s' % (language, slashed_path, full_path[len(path):]), 'missing', False
+    if app_settings.URLI18N_DISPATCH_MODE == 'urlconf':
+        return None
+    language_from_path = utils.get_language_prefix(path)
+    if language_from_path is None or language_from_path not in utils.get_language_codes():
+        return None
+    if language_from_path != language\
+    and not utils.is_internal_referer(request.META.get('HTTP_REFERER', None), request.get_host()):
+        language = language_from_path
+    #cut of the language shortcut
+    path = path[len(language_from_path) + 1:]
+    full_path = full_path[len(language_from_path) + 1:]
+    slashed_path = utils.append_slash(path)
+    full_path = slashed_path + full_path[len(path):]
+    if language_from_path == language and utils.show_language(language) and slashed_path == path:
+        return None
+    if not utils.is_included_path(slashed_path):
+        return None
+    if language_from_path != language:
+        cause = 'switch'
+    elif not utils.show_language(language):
+        cause = 'default'
+    else:
+        cause = 'slash'
+    if utils.show_language(language):
+        return '/%s%s' % (language, full_path), cause, True
+    return full_path, cause, True
+
+def _get_querystring_redirect(request, language):
+    """Private helper function returning the redirect of
+    ``UrlQuerystringTransformMiddleware``, see ``get_redirect``."""
+    path = request.path_info
+    slashed_path = utils.append_slash(path)
+    if not utils.is_included_path(slashed_path):
+        return None
+    full_path = request.get_full_path()
+    querystring_name = app_settings.URLI18N_QUERYSTRING_NAME
+    path_parts, querystring_parts, language_querystring, language_querystring_position = utils.break_full_path(full_path)
+    if slashed_path != path:
+        path_parts[0] += '/'
+        full_path = utils.reconstruct_full_path(path_parts[0], querystring_parts)
+    if app_settings.URLI18N_CANONICAL_QUERYSTRING:
+        querystring_parts, language_querystring_position = utils.canonical_querystring(
+            querystring_parts, language_querystring_position)
+        full_path = utils.reconstruct_full_path(path_parts[0], querystring_parts)
+    if language_querystring\
+    and not utils.is_internal_referer(request.META.get('HTTP_REFERER', None), request.get_host()):
+        language_from_querystring = language_querystring.replace('%s=' % querystring_name, '')
+        if language_from_querystring in utils.get_language_codes():
+            language = language_from_querystring
+    language_querystring = '%s=%s' % (querystring_name, language)
+    if app_settings.URLI18N_ALWAYS_SHOW_LANGUAGE is False and settings.LANGUAGE_CODE == language:
+        if language_querystring_position is not None:
+            querystring_parts.pop(language_querystring_position)
+            full_path = utils.reconstruct_full_path(path_parts[0], querystring_parts)
+            cause = 'default'
+        elif slashed_path != path:
+            cause = 'slash'
+        else:
+            cause = 'canonical'
+        if full_path != request.get_full_path():
+            return full_path, cause, language_querystring_position is not None
+        return None
+    if language_querystring_position is not None\
+    and language_querystring != querystring_parts[language_querystring_position]:
+        querystring_parts[language_querystring_position] = language_querystring
+        return utils.reconstruct_full_path(path_parts[0], querystring_parts), 'switch', True
+    if language_querystring_position is None:
+        if slashed_path == path and app_settings.URLI18N_SERVE_IN_PLACE:
+            return None
+        querystring_parts.append(language_querystring)
+        return utils.reconstruct_full_path(path_parts[0], querystring_parts), 'missing', False
+    if full_path != request.get_full_path():
+        return full_path, slashed_path != path and 'slash' or 'canonical', True
+    return None